@@ -0,0 +1,96 @@
+"""
+Measures the recall and query time of the approximate nearest-neighbour index.
+
+Builds a synthetic league (see synthetic_league.py) in which most managers
+start from a few popular "template" squads and change some players, indexes it
+with ann.TeamIndex, and compares the neighbours of a sample of teams with an
+exact cosine search.
+
+Usage:
+    python benchmarks/ann_recall.py [--teams N] [--neighbours K] [--queries Q] [--template-share S]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from synthetic_league import SyntheticLeague
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fpl_similarity import ann, vectorize  # noqa: E402
+
+
+def exact_neighbours(index, rows, k, block=100):
+    """Returns the exact top-k cosine neighbours of `rows`, excluding themselves."""
+    tops, top_scores = [], []
+    for start in range(0, len(rows), block):
+        chunk = rows[start:start + block]
+        similarities = (index.vectors[chunk] @ index.vectors.T).toarray()
+        similarities[np.arange(len(chunk)), chunk] = -np.inf
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        tops.append(top)
+        top_scores.append(np.take_along_axis(similarities, top, axis=1))
+    return np.concatenate(tops), np.concatenate(top_scores)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ANN recall and query time against exact search.')
+    parser.add_argument('--teams', type=int, default=100000, help='Teams in the synthetic league (default: %(default)s)')
+    parser.add_argument('--neighbours', type=int, default=10, help='Neighbours per query (default: %(default)s)')
+    parser.add_argument('--queries', type=int, default=1000, help='Teams queried (default: %(default)s)')
+    parser.add_argument('--bands', type=int, default=ann.BANDS, help='LSH bands (default: %(default)s)')
+    parser.add_argument('--template-share', type=float, default=0.6, help='Share of template managers (default: %(default)s)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    teams, captains, chips, player_prices = SyntheticLeague(args.teams, template_share=args.template_share).squads()
+    print(f"{'synthetic league':<25} {time.perf_counter() - start:8.3f}s")
+    start = time.perf_counter()
+    team_matrix, _ = vectorize.build_team_matrix(teams, captains, chips, vectorize.price_lookup(player_prices))
+    print(f"{'team matrix':<25} {time.perf_counter() - start:8.3f}s  {team_matrix.shape[0]} teams")
+
+    start = time.perf_counter()
+    index = ann.TeamIndex(team_matrix, bands=args.bands)
+    print(f"{'index build':<25} {time.perf_counter() - start:8.3f}s")
+
+    rows = np.random.default_rng(1).choice(len(index), min(args.queries, len(index)), replace=False)
+    k = args.neighbours
+    latencies, found = [], []
+    for row in rows:
+        start = time.perf_counter()
+        neighbours, _ = index.query_row(row, k, exact_fallback=False)
+        latencies.append(time.perf_counter() - start)
+        found.append(neighbours)
+
+    start = time.perf_counter()
+    exact, exact_scores = exact_neighbours(index, rows, k)
+    exact_time = (time.perf_counter() - start) / len(rows)
+
+    # Ties at the k-th similarity make several answers equally correct, so a
+    # neighbour counts as found if it is at least as similar as the k-th exact one
+    hits = 0
+    for neighbours, truth_scores, row in zip(found, exact_scores, rows):
+        if len(neighbours):
+            scores = (index.vectors[neighbours] @ index.vectors[row].T).toarray().ravel()
+            hits += int(np.sum(scores >= truth_scores.min() - 1e-12))
+    recall = hits / (len(rows) * k)
+
+    latencies = np.array(latencies) * 1000
+    print(f"{'recall@' + str(k):<25} {recall:8.3f}")
+    print(f"{'ANN query (median)':<25} {np.median(latencies):8.3f}ms")
+    print(f"{'ANN query (p99)':<25} {np.percentile(latencies, 99):8.3f}ms")
+    print(f"{'exact query':<25} {exact_time * 1000:8.3f}ms")
+
+    start = time.perf_counter()
+    labels = index.template_clusters()
+    clustered = labels >= 0
+    print(f"{'template clusters':<25} {time.perf_counter() - start:8.3f}s  "
+          f"{labels.max() + 1} clusters covering {clustered.mean():.1%} of teams")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Times the whole pipeline end to end against synthetic leagues, without network access.
+
+For each league size, a SyntheticLeague is served by the local stand-in server
+(see synthetic_league.py) and the pipeline runs in a fresh process and working
+directory with FPL_API_SERVER pointing at it. The per-stage times, request and
+cache counters, and peak RSS come from the pipeline's own run report (see
+fpl_similarity/metrics.py). With --warm, each size is run a second time over
+the same working directory, measuring a rerun with the caches filled. With
+--live as well, the current gameweek is still being played and some managers
+score between the two runs, so the second run measures a delta refresh.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [--managers 1000 10000 100000] [--template-share 0.6]
+        [--chip-rate 0.05] [--jobs N] [--backend sklearn] [--warm [--live]] [--output results.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_league import SyntheticLeague, serve
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = ('fetch', 'process_picks', 'group', 'vectorize', 'pca', 'tsne', 'write', 'index', 'history')
+
+# The stand-in server answers locally, so the pipeline's politeness limit is lifted
+REQUESTS_PER_SECOND = 100000
+
+
+def run_pipeline(base_url, work_directory, league, jobs, backend):
+    """
+    Runs the pipeline once in a subprocess and returns its run report.
+
+    Raises:
+        subprocess.CalledProcessError: If the pipeline exits with an error.
+    """
+    for directory in ('src/assets', 'cache', 'graphs'):
+        os.makedirs(os.path.join(work_directory, directory), exist_ok=True)
+    report_file = os.path.join(work_directory, 'cache', 'run_report.json')
+    env = dict(os.environ, FPL_API_SERVER=base_url, PYTHONPATH=REPO_ROOT)
+    env.pop('FPL_API_FIXTURES', None)
+    command = [
+        sys.executable, '-m', 'fpl_similarity.pipeline',
+        '--leagues', str(league.league_id),
+        '--gameweeks', str(league.gameweeks),
+        '--jobs', str(jobs),
+        '--backend', backend,
+        '--requests-per-second', str(REQUESTS_PER_SECOND),
+        '--report', report_file,
+    ]
+    with open(os.path.join(work_directory, 'analysis.log'), 'a') as log:
+        subprocess.run(command, cwd=work_directory, env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+    with open(report_file, 'r') as f:
+        return json.load(f)
+
+
+def summarize(managers, label, report):
+    """Extracts the figures printed and saved for one run."""
+    counters = report['counters']
+    return {
+        'managers': managers,
+        'run': label,
+        'wall_seconds': report['wall_seconds'],
+        'managers_per_second': managers / report['wall_seconds'],
+        'peak_rss_mib': report['peak_rss_bytes'] / 2**20,
+        'stages': {name: report['stages'].get(name, {}).get('wall_seconds', 0.0) for name in STAGES},
+        'api_requests': counters.get('api_requests', 0),
+        'picks_cache_hits': counters.get('picks_cache_hits', 0),
+        'unique_teams': counters.get('unique_teams', 0),
+    }
+
+
+def print_table(results):
+    header = f"{'managers':>9} {'run':<5} {'total':>8} {'mgr/s':>8} {'RSS MiB':>8} {'requests':>9} {'unique':>7} " + \
+        ' '.join(f'{name:>13}' for name in STAGES)
+    print(header)
+    for result in results:
+        print(f"{result['managers']:>9} {result['run']:<5} {result['wall_seconds']:>7.2f}s {result['managers_per_second']:>8.0f} "
+              f"{result['peak_rss_mib']:>8.0f} {result['api_requests']:>9} {result['unique_teams']:>7} "
+              + ' '.join(f"{result['stages'][name]:>12.3f}s" for name in STAGES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline end to end against synthetic leagues.')
+    parser.add_argument('--managers', type=int, nargs='+', default=[1000, 10000], help='League sizes to run (default: %(default)s)')
+    parser.add_argument('--gameweeks', type=int, default=1, help='Current gameweek of the synthetic season (default: %(default)s)')
+    parser.add_argument('--template-share', type=float, default=0.6, help='Share of template managers (default: %(default)s)')
+    parser.add_argument('--chip-rate', type=float, default=0.05, help='Share of managers playing a chip (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic leagues (default: %(default)s)')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='Pipeline worker processes (default: %(default)s)')
+    parser.add_argument('--backend', default='sklearn', help='Embedding backend (default: %(default)s)')
+    parser.add_argument('--warm', action='store_true', help='Also time a second run with the caches filled')
+    parser.add_argument('--live', action='store_true', help='Leave the current gameweek unfinished and add points before the warm run')
+    parser.add_argument('--keep', action='store_true', help='Keep the working directories for inspection')
+    parser.add_argument('--output', help='Save the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    for managers in args.managers:
+        league = SyntheticLeague(managers, args.gameweeks, template_share=args.template_share,
+                                 chip_rate=args.chip_rate, live=args.live, seed=args.seed)
+        server = serve(league)
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+        work_directory = tempfile.mkdtemp(prefix=f'fpl-benchmark-{managers}-')
+        try:
+            start = time.perf_counter()
+            league.totals()  # Generated up front so the standings fetch is not charged for it
+            print(f"{managers} managers: league generated in {time.perf_counter() - start:.1f}s, running in {work_directory}")
+            runs = ['cold', 'warm'] if args.warm else ['cold']
+            for label in runs:
+                if label == 'warm' and args.live:
+                    league.advance()
+                    league.totals()
+                report = run_pipeline(base_url, work_directory, league, args.jobs, args.backend)
+                results.append(summarize(managers, label, report))
+        finally:
+            server.shutdown()
+            server.server_close()
+            if not args.keep:
+                shutil.rmtree(work_directory, ignore_errors=True)
+
+    print()
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Measures how long the pipeline takes to start, and fails if it is over target.
+
+Each command runs in a fresh interpreter several times and the best time is
+reported, so the figures reflect import cost rather than machine noise.
+
+Usage:
+    python benchmarks/startup_time.py [--repeat N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Best-of-N wall time, in seconds, that each command must stay under
+STARTUP_TARGETS = {
+    'import fpl_similarity.pipeline': ([sys.executable, '-c', 'import fpl_similarity.pipeline'], 0.5),
+    'analysis.py --help': ([sys.executable, 'analysis.py', '--help'], 0.5),
+}
+
+
+def best_time(command, repeat):
+    """Returns the fastest of `repeat` runs of `command`, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the pipeline's startup time against its target.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per command (default: %(default)s)")
+    args = parser.parse_args()
+
+    baseline = best_time([sys.executable, '-c', 'pass'], args.repeat)
+    print(f"{'bare interpreter':<35} {baseline:6.3f}s")
+
+    over_target = False
+    for name, (command, target) in STARTUP_TARGETS.items():
+        elapsed = best_time(command, args.repeat)
+        status = 'ok' if elapsed <= target else 'OVER TARGET'
+        over_target |= elapsed > target
+        print(f"{name:<35} {elapsed:6.3f}s  (target {target:.2f}s) {status}")
+    return 1 if over_target else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""
+Synthetic FPL API payloads and a local stand-in server that serves them.
+
+SyntheticLeague generates bootstrap-static, league standings and picks payloads
+in the shapes the FPL API returns, for a classic league of any size:
+
+* Players are split over 20 clubs and the four positions, and ownership follows
+  a power law within each position, as it does in real leagues.
+* In gameweek 1, a `template_share` of the managers start from one of
+  `templates` popular squads (themselves drawn by popularity, with a few
+  popular templates much more common than the rest) and change a few players;
+  the others pick their squads from the ownership distribution directly.
+* Each later gameweek's squad is the previous one with 0 to `max_transfers`
+  transfers, as in the real game. A wildcard redraws the squad for good, a free
+  hit for that gameweek only.
+* A `chip_rate` of the managers play a chip each gameweek.
+* With `live`, the current gameweek has not finished: each `advance` (every
+  `live_interval` seconds when served) adds points to a `live_change_rate` of
+  the managers, which the standings and picks then report.
+
+Every payload is derived from (seed, team ID, gameweek, live step), so the same
+league comes back on every run; only the squads already derived are kept in
+memory. `serve` runs an HTTP server answering the FPL API paths the pipeline
+requests; point the pipeline at it with FPL_API_SERVER=http://127.0.0.1:<port>.
+
+Usage:
+    python benchmarks/synthetic_league.py --managers 10000 --port 8000 [--live --live-interval 60]
+"""
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+N_CLUBS = 20
+# Players per position (GK, DEF, MID, FWD), roughly as in a real season
+PLAYERS_PER_POSITION = (80, 250, 280, 90)
+# Squad slots per position, and the starting XI (a 4-4-2) taken from them
+SQUAD_SLOTS = (2, 5, 5, 3)
+STARTERS = (1, 4, 4, 2)
+_CUMULATIVE_SLOTS = np.cumsum(SQUAD_SLOTS) / sum(SQUAD_SLOTS)
+CHIPS = ('bboost', '3xc', 'freehit', 'wildcard')
+STANDINGS_PAGE_SIZE = 50
+FIRST_TEAM_ID = 1000
+
+
+class SyntheticLeague:
+    """
+    A deterministic synthetic classic league.
+
+    Args:
+        managers (int): Number of managers in the league.
+        gameweeks (int): The current gameweek; earlier gameweeks are finished.
+        league_id (int): The league ID used in the standings payloads.
+        template_share (float): Fraction of managers starting from a template squad.
+        templates (int): Number of template squads.
+        max_changes (int): Most players a template manager changes in gameweek 1.
+        max_transfers (int): Most transfers a manager makes between two gameweeks.
+        chip_rate (float): Fraction of managers playing a chip in a gameweek.
+        popularity_exponent (float): Power-law exponent of ownership; higher
+            values concentrate ownership on fewer players.
+        live (bool): Whether the current gameweek is still being played.
+        live_change_rate (float): Fraction of managers scoring points at each `advance`.
+        seed (int): Seed from which every payload is derived.
+    """
+
+    def __init__(self, managers, gameweeks=1, league_id=1, template_share=0.6, templates=20,
+                 max_changes=3, max_transfers=2, chip_rate=0.05, popularity_exponent=1.0,
+                 live=False, live_change_rate=0.2, seed=0):
+        self.managers = managers
+        self.gameweeks = gameweeks
+        self.league_id = league_id
+        self.template_share = template_share
+        self.max_changes = max_changes
+        self.max_transfers = max_transfers
+        self.chip_rate = chip_rate
+        self.live = live
+        self.live_change_rate = live_change_rate
+        self.live_step = 0
+        self.seed = seed
+
+        rng = np.random.default_rng([seed, 0])
+        self.positions = []  # Player IDs of each position, most popular first
+        self.popularity = []  # Their selection probabilities
+        self._log_popularity = []
+        self._cumulative_popularity = []
+        player_id = 1
+        for count in PLAYERS_PER_POSITION:
+            self.positions.append(np.arange(player_id, player_id + count))
+            weights = 1.0 / np.arange(1, count + 1) ** popularity_exponent
+            self.popularity.append(weights / weights.sum())
+            self._log_popularity.append(np.log(self.popularity[-1]))
+            self._cumulative_popularity.append(np.cumsum(self.popularity[-1]))
+            player_id += count
+        self.n_players = player_id - 1
+        self.clubs = rng.integers(1, N_CLUBS + 1, size=self.n_players + 1)
+        # Popular players are the expensive ones
+        self.prices = np.zeros(self.n_players + 1, dtype=np.int64)
+        for ids, popularity in zip(self.positions, self.popularity):
+            rank = np.arange(len(ids)) / len(ids)
+            self.prices[ids] = np.round(40 + 100 * (1 - rank) ** 3 + rng.uniform(0, 5, len(ids))).astype(np.int64)
+
+        self.templates = [self._random_squad(rng) for _ in range(templates)]
+        weights = 1.0 / np.arange(1, templates + 1)
+        self.template_weights = weights / weights.sum()
+        self._cumulative_template_weights = np.cumsum(self.template_weights)
+        self._totals = None
+        self._totals_step = None
+        self._totals_lock = threading.Lock()
+        self._squads = {}  # (team ID, gameweek) -> squad kept for the next gameweek
+
+    @property
+    def team_ids(self):
+        """The team IDs of the league's managers, in standings order."""
+        return range(FIRST_TEAM_ID, FIRST_TEAM_ID + self.managers)
+
+    def _random_squad(self, rng):
+        """Draws a squad by ownership: a list of player IDs per position."""
+        # Weighted sampling without replacement via the Gumbel top-k trick, which
+        # is much faster than rng.choice(..., replace=False, p=...)
+        squad = []
+        for ids, log_popularity, slots in zip(self.positions, self._log_popularity, SQUAD_SLOTS):
+            keys = log_popularity + rng.gumbel(size=len(ids))
+            squad.append(list(ids[np.argpartition(-keys, slots - 1)[:slots]]))
+        return squad
+
+    def _random_player(self, rng, position):
+        """Draws one player of a position by ownership."""
+        cumulative = self._cumulative_popularity[position]
+        return self.positions[position][min(np.searchsorted(cumulative, rng.random() * cumulative[-1]), len(cumulative) - 1)]
+
+    def _rng(self, team_id, gameweek, stream=0):
+        return np.random.default_rng([self.seed, team_id, gameweek, stream])
+
+    def _transfer(self, rng, squad, changes):
+        """Replaces up to `changes` players of a squad, in place, keeping their positions."""
+        for _ in range(changes):
+            position = min(np.searchsorted(_CUMULATIVE_SLOTS, rng.random()), 3)
+            replacement = self._random_player(rng, position)
+            if replacement not in squad[position]:
+                squad[position][rng.integers(len(squad[position]))] = replacement
+
+    def _initial_squad(self, rng):
+        """Draws a new squad: a template with a few changes, or one picked by ownership."""
+        if rng.random() < self.template_share:
+            template = min(np.searchsorted(self._cumulative_template_weights, rng.random()), len(self.templates) - 1)
+            squad = [list(slots) for slots in self.templates[template]]
+            self._transfer(rng, squad, rng.integers(0, self.max_changes + 1))
+            return squad
+        return self._random_squad(rng)
+
+    def chip(self, team_id, gameweek):
+        """Returns the chip a manager plays in a gameweek, or None."""
+        rng = self._rng(team_id, gameweek, stream=3)
+        return str(rng.choice(CHIPS)) if rng.random() < self.chip_rate else None
+
+    def _kept_squad(self, team_id, gameweek):
+        """Returns the squad a manager carries into the next gameweek (free hits revert)."""
+        key = (team_id, gameweek)
+        squad = self._squads.get(key)
+        if squad is None:
+            rng = self._rng(team_id, gameweek, stream=2)
+            if gameweek == 1 or self.chip(team_id, gameweek) == 'wildcard':
+                squad = self._initial_squad(rng)
+            else:
+                squad = [list(slots) for slots in self._kept_squad(team_id, gameweek - 1)]
+                self._transfer(rng, squad, rng.integers(0, self.max_transfers + 1))
+            self._squads[key] = squad
+        return squad
+
+    def squad(self, team_id, gameweek):
+        """
+        Returns a manager's squad, captain and chip for a gameweek.
+
+        Returns:
+            tuple: (list of (player_id, position) tuples, captain ID, vice-captain ID, chip or None).
+        """
+        rng = self._rng(team_id, gameweek)
+        chip = self.chip(team_id, gameweek)
+        if chip == 'freehit':
+            squad = self._initial_squad(rng)
+        else:
+            squad = self._kept_squad(team_id, gameweek)
+
+        starters = [player for slots, n in zip(squad, STARTERS) for player in slots[:n]]
+        bench = [player for slots, n in zip(squad, STARTERS) for player in slots[n:]]
+        team = [(int(player), position) for position, player in enumerate(starters + bench, start=1)]
+        # Most managers captain the most popular (lowest ID) midfielder or forward they own
+        attackers = sorted(starters[5:])
+        captain = int(attackers[0] if rng.random() < 0.7 else rng.choice(starters[1:]))
+        vice_captain = int(next(player for player in attackers + starters if player != captain))
+        return team, captain, vice_captain, chip
+
+    def advance(self):
+        """Moves a live gameweek on by one step, in which some managers score more points."""
+        self.live_step += 1
+
+    def _points(self, team_id, gameweek):
+        """Returns a manager's (gameweek points, transfer cost) for a gameweek."""
+        rng = self._rng(team_id, gameweek, stream=1)
+        points, cost = int(rng.integers(20, 100)), int(rng.choice([0, 0, 0, 4]))
+        if self.live and gameweek == self.gameweeks:
+            # Live points start low and grow with the steps the manager scored in
+            points //= 4
+            for step in range(1, self.live_step + 1):
+                step_rng = self._rng(team_id, gameweek, stream=100 + step)
+                if step_rng.random() < self.live_change_rate:
+                    points += int(step_rng.integers(1, 10))
+        return points, cost
+
+    def _total(self, team_id, gameweek):
+        return sum(points - cost for points, cost in (self._points(team_id, gw) for gw in range(1, gameweek + 1)))
+
+    def bootstrap_static(self):
+        """The bootstrap-static payload: players and gameweeks."""
+        elements = []
+        for element_type, ids in enumerate(self.positions, start=1):
+            for player_id in ids:
+                elements.append({
+                    'id': int(player_id),
+                    'web_name': f'Player {player_id}',
+                    'element_type': element_type,
+                    'team': int(self.clubs[player_id]),
+                    'now_cost': int(self.prices[player_id]),
+                })
+        events = [
+            {'id': gw, 'is_current': gw == self.gameweeks, 'finished': gw < self.gameweeks or (gw == self.gameweeks and not self.live)}
+            for gw in range(1, 39)
+        ]
+        return {'elements': elements, 'events': events}
+
+    def standings(self, page):
+        """One page of the league standings, ranked by total points."""
+        totals = self.totals()
+        order = np.argsort(-totals, kind='stable')
+        start = (page - 1) * STANDINGS_PAGE_SIZE
+        results = []
+        for rank, index in enumerate(order[start:start + STANDINGS_PAGE_SIZE], start=start + 1):
+            team_id = FIRST_TEAM_ID + int(index)
+            results.append({
+                'entry': team_id,
+                'entry_name': f'Team {team_id}',
+                'player_name': f'Manager {team_id}',
+                'rank': rank,
+                'last_rank': rank,
+                'event_total': self._points(team_id, self.gameweeks)[0],
+                'total': int(totals[index]),
+            })
+        return {
+            'league': {'id': self.league_id, 'name': f'Synthetic league ({self.managers} managers)'},
+            'standings': {'page': page, 'has_next': start + STANDINGS_PAGE_SIZE < self.managers, 'results': results},
+            'new_entries': {'results': []},
+        }
+
+    def totals(self):
+        """Every manager's total points, computed on first use at each live step."""
+        with self._totals_lock:
+            if self._totals is None or self._totals_step != self.live_step:
+                self._totals_step = self.live_step
+                self._totals = np.array([self._total(team_id, self.gameweeks) for team_id in self.team_ids])
+            return self._totals
+
+    def picks(self, team_id, gameweek):
+        """A manager's picks payload for a gameweek, or None for teams outside the league."""
+        if team_id not in self.team_ids or not 1 <= gameweek <= self.gameweeks:
+            return None
+        team, captain, vice_captain, chip = self.squad(team_id, gameweek)
+        points, cost = self._points(team_id, gameweek)
+        picks = []
+        for player_id, position in team:
+            multiplier = 1 if position <= 11 or chip == 'bboost' else 0
+            if player_id == captain:
+                multiplier = 3 if chip == '3xc' else 2
+            picks.append({
+                'element': player_id,
+                'position': position,
+                'multiplier': multiplier,
+                'is_captain': player_id == captain,
+                'is_vice_captain': player_id == vice_captain,
+            })
+        return {
+            'active_chip': chip,
+            'picks': picks,
+            'entry_history': {
+                'event': gameweek,
+                'points': points,
+                'total_points': self._total(team_id, gameweek),
+                'rank': int(team_id - FIRST_TEAM_ID + 1),
+                'overall_rank': int(team_id - FIRST_TEAM_ID + 1),
+                'event_transfers_cost': cost,
+            },
+        }
+
+    def squads(self, gameweek=None):
+        """
+        Returns every manager's team in the format process_picks returns.
+
+        Returns:
+            tuple: (teams, captains, active_chips, player_prices), one entry per manager.
+        """
+        gameweek = gameweek or self.gameweeks
+        teams, captains, chips = [], [], []
+        for team_id in self.team_ids:
+            team, captain, _, chip = self.squad(team_id, gameweek)
+            teams.append(team)
+            captains.append(captain)
+            chips.append(chip)
+        player_prices = {player_id: self.prices[player_id] / 10 for player_id in range(1, self.n_players + 1)}
+        return teams, captains, chips, player_prices
+
+
+_PICKS_PATH = re.compile(r'^/api/entry/(\d+)/event/(\d+)/picks/?$')
+_STANDINGS_PATH = re.compile(r'^/api/leagues-classic/(\d+)/standings/?$')
+
+
+def make_handler(league):
+    """Returns a request handler class serving `league` on the FPL API paths."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, as the FPL API does
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            payload = None
+            if parts.path.rstrip('/') == '/api/bootstrap-static':
+                payload = league.bootstrap_static()
+            elif _STANDINGS_PATH.match(parts.path):
+                if int(_STANDINGS_PATH.match(parts.path).group(1)) == league.league_id:
+                    page = int(parse_qs(parts.query).get('page_standings', ['1'])[0])
+                    payload = league.standings(page)
+            elif _PICKS_PATH.match(parts.path):
+                team_id, gameweek = map(int, _PICKS_PATH.match(parts.path).groups())
+                payload = league.picks(team_id, gameweek)
+
+            if payload is None:
+                self._send(404, b'{"detail":"Not found."}')
+                return
+            body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+            etag = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+            if self.headers.get('If-None-Match') == etag:
+                self._send(304, b'', etag)
+            else:
+                self._send(200, body, etag)
+
+        def _send(self, status, body, etag=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if etag:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(league, port=0, live_interval=None):
+    """
+    Starts the stand-in FPL API server for `league` on a background thread.
+
+    Args:
+        league (SyntheticLeague): The league to serve.
+        port (int): The port to listen on; 0 picks a free one.
+        live_interval (float): For a live league, seconds between two `advance` calls.
+
+    Returns:
+        ThreadingHTTPServer: The running server; its base URL is
+        f'http://127.0.0.1:{server.server_address[1]}'. Call `shutdown()` to stop it.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(league))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    if league.live and live_interval:
+        def advance():
+            while True:
+                time.sleep(live_interval)
+                league.advance()
+        threading.Thread(target=advance, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a synthetic FPL league on the FPL API paths.')
+    parser.add_argument('--managers', type=int, default=1000, help='Managers in the league (default: %(default)s)')
+    parser.add_argument('--gameweeks', type=int, default=1, help='Current gameweek (default: %(default)s)')
+    parser.add_argument('--league-id', type=int, default=1, help='League ID (default: %(default)s)')
+    parser.add_argument('--template-share', type=float, default=0.6, help='Share of template managers (default: %(default)s)')
+    parser.add_argument('--chip-rate', type=float, default=0.05, help='Share of managers playing a chip (default: %(default)s)')
+    parser.add_argument('--live', action='store_true', help='Serve the current gameweek as still being played')
+    parser.add_argument('--live-interval', type=float, default=60, help='Seconds between live points updates (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on (default: %(default)s)')
+    args = parser.parse_args()
+
+    league = SyntheticLeague(args.managers, args.gameweeks, args.league_id, args.template_share,
+                             chip_rate=args.chip_rate, live=args.live, seed=args.seed)
+    server = serve(league, args.port, args.live_interval)
+    print(f"Serving league {args.league_id} ({args.managers} managers) on http://127.0.0.1:{server.server_address[1]}")
+    print(f"Run the pipeline with FPL_API_SERVER=http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
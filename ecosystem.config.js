@@ -9,6 +9,32 @@ module.exports = {
         PORT: 8081,
         NODE_ENV: "production",
         MY_ENV_VAR: "MyVarValue",
+        FPL_DATA_DIRECTORY: "./data",
+        FPL_SIMILARITY_API: "http://127.0.0.1:8082",
+      },
+    },
+    {
+      // Recomputes the results as gameweeks go live and finish, writing them to
+      // FPL_DATA_DIRECTORY where the server above picks them up
+      name: "fpl-league-similarity-refresh",
+      script: "./venv/bin/python",
+      args: "-m fpl_similarity.daemon --jobs 2",
+      interpreter: "none",
+      watch: false,
+      kill_timeout: 30000,
+      env: {
+        FPL_DATA_DIRECTORY: "./data",
+      },
+    },
+    {
+      // Computes and serves the results of any league on demand, behind /api
+      name: "fpl-league-similarity-service",
+      script: "./venv/bin/python",
+      args: "-m fpl_similarity.service --port 8082 --workers 2",
+      interpreter: "none",
+      watch: false,
+      env: {
+        FPL_DATA_DIRECTORY: "./data",
       },
     },
   ],
@@ -0,0 +1,5 @@
+"""
+FPL league similarity: groups Fantasy Premier League managers by team composition.
+
+The pipeline lives in fpl_similarity.pipeline; the other modules are its building blocks.
+"""
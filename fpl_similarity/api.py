@@ -0,0 +1,408 @@
+"""
+Rate-limited, concurrent access to the Fantasy Premier League API.
+
+Every request made by the pipeline goes through `get`, which enforces a global
+requests-per-second budget (token bucket), a cap on the number of requests in
+flight, a per-request timeout, and retries with exponential backoff on
+throttling (429) and server errors (5xx). `map_concurrently` runs a fetch
+function over many inputs on a thread pool while keeping results in input order.
+
+All requests share one pooled `requests.Session`, so TCP/TLS connections are
+kept alive and reused across calls. The transport behind the session can be
+swapped with `set_transport`, e.g. for a `FixtureAdapter` that serves recorded
+responses from disk (set FPL_API_FIXTURES to a fixture directory to do this
+for a whole run). `RecordingAdapter` writes live responses in the same layout,
+and `RedirectAdapter` sends the requests to another server, such as the local
+stand-in used by the benchmarks (set FPL_API_SERVER to its base URL).
+"""
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from fpl_similarity import metrics
+
+# Default politeness settings; change them at runtime with configure()
+REQUESTS_PER_SECOND = 5
+MAX_CONCURRENT_REQUESTS = 8
+REQUEST_TIMEOUT = 15  # Seconds
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # Seconds, doubled on every retry
+BACKOFF_MAX = 60.0  # Seconds
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+API_BASE_URL = 'https://fantasy.premierleague.com/'
+
+# Validators and bodies of responses fetched with conditional=True
+HTTP_CACHE_DIRECTORY = './cache/http'
+
+DEFAULT_HEADERS = {
+    'Accept': 'application/json',
+    'Accept-Encoding': 'gzip, deflate',
+    'User-Agent': 'fpl-league-similarity',
+}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to limit the request rate.
+
+    Tokens are refilled continuously at `rate` per second up to `capacity`.
+    Each call to `acquire` consumes one token, sleeping until one is available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available, then consumes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FixtureAdapter(BaseAdapter):
+    """
+    Transport that answers requests from recorded JSON files instead of the network.
+
+    A URL maps to a file under `fixture_directory` via `fixture_path`. Requests
+    for URLs without a fixture get a 404 with the same body the FPL API sends.
+    """
+
+    def __init__(self, fixture_directory):
+        super().__init__()
+        self.fixture_directory = fixture_directory
+
+    def send(self, request, **kwargs):
+        path = fixture_path(self.fixture_directory, request.url)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return _build_response(request, 200, f.read())
+        return _build_response(request, 404, b'{"detail":"Not found."}')
+
+    def close(self):
+        pass
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    Transport that performs real requests and saves every 200 response as a fixture.
+
+    The files it writes can be served back later with `FixtureAdapter`.
+    """
+
+    def __init__(self, fixture_directory, **kwargs):
+        super().__init__(**kwargs)
+        self.fixture_directory = fixture_directory
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            path = fixture_path(self.fixture_directory, request.url)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(response.content)
+        return response
+
+
+class RedirectAdapter(HTTPAdapter):
+    """
+    Transport that sends requests to another server, keeping their path and query.
+
+    Used to point the pipeline at a stand-in for the FPL API, e.g.
+    `RedirectAdapter('http://127.0.0.1:8000')`.
+    """
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request = request.copy()
+        request.url = f"{self.base_url}{parts.path}{'?' + parts.query if parts.query else ''}"
+        return super().send(request, **kwargs)
+
+
+def fixture_path(fixture_directory, url):
+    """
+    Returns the fixture file used for a URL.
+
+    The URL path becomes the directory structure and the query string, if any,
+    becomes part of the file name, e.g.
+    `api/leagues-classic/1/standings/?page_standings=2` is stored as
+    `api/leagues-classic/1/standings/page_standings=2.json`.
+    """
+    parts = urlsplit(url)
+    path = parts.path.strip('/') or 'index'
+    if parts.query:
+        path = f"{path}/{parts.query.replace('&', '_')}"
+    return os.path.join(fixture_directory, f'{path}.json')
+
+
+def _build_response(request, status_code, content, headers=None):
+    """Builds a requests.Response for content that did not come from the network."""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers = CaseInsensitiveDict(headers or {'Content-Type': 'application/json'})
+    response.encoding = 'utf-8'
+    response.url = request.url if request is not None else None
+    response.request = request
+    return response
+
+
+_rate_limiter = TokenBucket(REQUESTS_PER_SECOND)
+_in_flight = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+_session = None
+_session_lock = threading.Lock()
+_transport = None
+
+
+def configure(requests_per_second=None, max_concurrent_requests=None, http_cache_directory=None):
+    """
+    Changes the global rate limit, concurrency cap and/or HTTP cache location.
+
+    Args:
+        requests_per_second (float): Sustained request rate across all threads.
+        max_concurrent_requests (int): Maximum number of requests in flight at once.
+        http_cache_directory (str): Where conditional request validators are stored.
+    """
+    global _rate_limiter, _in_flight, _session, REQUESTS_PER_SECOND, MAX_CONCURRENT_REQUESTS, HTTP_CACHE_DIRECTORY
+    if requests_per_second is not None:
+        REQUESTS_PER_SECOND = requests_per_second
+        _rate_limiter = TokenBucket(requests_per_second)
+    if max_concurrent_requests is not None:
+        MAX_CONCURRENT_REQUESTS = max_concurrent_requests
+        _in_flight = threading.BoundedSemaphore(max_concurrent_requests)
+        _session = None  # Rebuilt on next use with a matching pool size
+    if http_cache_directory is not None:
+        HTTP_CACHE_DIRECTORY = http_cache_directory
+
+
+def set_transport(adapter):
+    """
+    Replaces the transport used for FPL API requests.
+
+    Args:
+        adapter (requests.adapters.BaseAdapter): The adapter to mount for
+            API_BASE_URL, or None to go back to the default pooled HTTP adapter.
+    """
+    global _transport, _session
+    _transport = adapter
+    _session = None
+
+
+def get_session():
+    """
+    Returns the shared session, creating it on first use.
+
+    The default transport keeps up to MAX_CONCURRENT_REQUESTS connections alive
+    per host so concurrent fetches reuse them rather than reconnecting.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            adapter = _transport
+            if adapter is None and os.environ.get('FPL_API_FIXTURES'):
+                adapter = FixtureAdapter(os.environ['FPL_API_FIXTURES'])
+            if adapter is None and os.environ.get('FPL_API_SERVER'):
+                adapter = RedirectAdapter(os.environ['FPL_API_SERVER'], pool_connections=4,
+                                          pool_maxsize=MAX_CONCURRENT_REQUESTS, max_retries=0)
+            if adapter is None:
+                # Retries are handled in get(), so urllib3 must not retry on its own
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENT_REQUESTS, max_retries=0)
+            session.mount(API_BASE_URL, adapter)
+            _session = session
+        return _session
+
+
+def _http_cache_path(url):
+    """Returns the file storing the conditional request validators for a URL."""
+    return os.path.join(HTTP_CACHE_DIRECTORY, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+
+def _load_http_cache(url):
+    """Loads the cached validators and body for a URL, or None if there are none."""
+    try:
+        with open(_http_cache_path(url), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _save_http_cache(url, response):
+    """Stores a response's validators and body so the next request can be conditional."""
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if not etag and not last_modified:
+        return
+    os.makedirs(HTTP_CACHE_DIRECTORY, exist_ok=True)
+    path = _http_cache_path(url)
+    # A unique temporary file, as the daemon and the service may save the same URL at once
+    fd, tmp_path = tempfile.mkstemp(dir=HTTP_CACHE_DIRECTORY, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'etag': etag, 'last_modified': last_modified, 'body': response.text}, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _retry_delay(attempt, response=None):
+    """
+    Returns how long to wait before retry number `attempt` (0-based).
+
+    Honours a numeric Retry-After header when the server sends one, otherwise
+    uses exponential backoff with jitter.
+    """
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(BACKOFF_MAX, float(retry_after))
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def get(url, timeout=None, max_retries=None, conditional=False):
+    """
+    Performs a rate-limited GET request, retrying on 429/5xx and network errors.
+
+    Args:
+        url (str): The URL to fetch.
+        timeout (float): Per-request timeout in seconds. Defaults to REQUEST_TIMEOUT.
+        max_retries (int): Number of retries after the first attempt. Defaults to MAX_RETRIES.
+        conditional (bool): If True, send the ETag/Last-Modified validators of the
+            previous response and serve its stored body when the server answers
+            304 Not Modified. The returned response then has `from_cache` set,
+            and the stored body and validators.
+
+    Returns:
+        requests.Response: The final response. It may still carry an error status
+        if the retries were exhausted, or for non-retryable errors such as 404.
+
+    Raises:
+        requests.RequestException: If the request keeps failing at the network level.
+    """
+    timeout = REQUEST_TIMEOUT if timeout is None else timeout
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+
+    headers = {}
+    cached = _load_http_cache(url) if conditional else None
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    for attempt in range(max_retries + 1):
+        _rate_limiter.acquire()
+        metrics.increment('api_requests')
+        start = time.perf_counter()
+        try:
+            with _in_flight:
+                response = get_session().get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.increment('api_network_errors')
+            if attempt == max_retries:
+                raise
+            delay = _retry_delay(attempt)
+            print(f"Request to {url} failed ({e.__class__.__name__}), retrying in {delay:.1f}s...")
+            metrics.increment('api_retries')
+            time.sleep(delay)
+            continue
+        metrics.observe('api_request_seconds', time.perf_counter() - start)
+        metrics.increment('api_bytes_read', len(response.content))
+
+        if response.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+            delay = _retry_delay(attempt, response)
+            print(f"Request to {url} returned {response.status_code}, retrying in {delay:.1f}s...")
+            metrics.increment('api_retries')
+            time.sleep(delay)
+            continue
+
+        if response.status_code >= 400:
+            metrics.increment('api_error_responses')
+        if cached and response.status_code == 304:
+            metrics.increment('http_cache_hits')
+            validators = {'ETag': cached.get('etag'), 'Last-Modified': cached.get('last_modified')}
+            headers = {'Content-Type': 'application/json', **{name: value for name, value in validators.items() if value}}
+            response = _build_response(response.request, 200, cached['body'].encode('utf-8'), headers)
+            response.from_cache = True
+        else:
+            response.from_cache = False
+            if conditional and response.status_code == 200:
+                _save_http_cache(url, response)
+        return response
+
+
+def map_concurrently(fn, items, max_workers=None):
+    """
+    Applies `fn` to every item on a thread pool and returns the results in input order.
+
+    The global rate limit and concurrency cap in `get` still apply, so the pool
+    size only bounds how many calls are waiting on the network at once.
+
+    Args:
+        fn (callable): The function to call for each item.
+        items (iterable): The inputs.
+        max_workers (int): Thread pool size. Defaults to MAX_CONCURRENT_REQUESTS.
+
+    Returns:
+        list: The results of `fn(item)` for each item, in the same order as `items`.
+    """
+    items = list(items)
+    if not items:
+        return []
+    max_workers = max_workers or MAX_CONCURRENT_REQUESTS
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(fn, items))
+
+
+def imap_unordered(fn, items, max_workers=None):
+    """
+    Applies `fn` to every item on a thread pool, yielding results as they complete.
+
+    Args:
+        fn (callable): The function to call for each item.
+        items (iterable): The inputs.
+        max_workers (int): Thread pool size. Defaults to MAX_CONCURRENT_REQUESTS.
+
+    Yields:
+        tuple: (item, fn(item)) pairs in completion order.
+    """
+    items = list(items)
+    if not items:
+        return
+    max_workers = max_workers or MAX_CONCURRENT_REQUESTS
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+    try:
+        futures = {executor.submit(fn, item): item for item in items}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        # Drop queued calls if the caller stops early (e.g. on an interrupt)
+        executor.shutdown(wait=True, cancel_futures=True)
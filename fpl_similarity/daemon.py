@@ -0,0 +1,219 @@
+"""
+Keeps the similarity results up to date from one long-running process.
+
+The cron job in update_script.sh ran the pipeline, rebuilt the Angular app and
+reloaded the server to publish new JSON assets. Instead, the daemon polls the
+FPL event status and recomputes the current gameweek of the leagues that need
+it: all of them when a gameweek goes live or finishes, and while a gameweek is
+live, only those whose standings changed since the last refresh. Results are
+written atomically (see output.write_atomic) to the data directory, which
+server.js serves directly when both are started with the same
+FPL_DATA_DIRECTORY, so a refresh needs no rebuild and no restart.
+
+Between refreshes the process keeps its worker pool, with scikit-learn already
+imported, the picks cache connection, the HTTP validators and the last
+standings of every league.
+
+Usage:
+    FPL_DATA_DIRECTORY=/srv/fpl-data python -m fpl_similarity.daemon [--leagues ID ...] [--jobs N]
+        [--poll-interval 300] [--live-interval 900] [--once]
+"""
+import argparse
+import fcntl
+import os
+import signal
+import sys
+import threading
+import time
+
+from fpl_similarity import api, embedding, metrics, pipeline
+
+# Seconds between two checks of the event status
+POLL_INTERVAL = 300
+
+# While a gameweek is live, seconds between two checks of the leagues' standings
+LIVE_INTERVAL = 900
+
+# Held by the running daemon, so a second one (e.g. update_script.sh next to the pm2 app) exits
+lock_file = f'{pipeline.CACHE_DIRECTORY}/daemon.lock'
+
+
+class RefreshDaemon:
+    """
+    Decides which leagues to recompute on each poll and runs the batches.
+
+    Args:
+        league_ids (list): The leagues kept up to date.
+        jobs (int): Worker processes for the CPU-bound steps.
+        backend (str): The embedding backend to use.
+        incremental (bool): Whether to warm-start from the previous gameweek's layout.
+        live_interval (float): Seconds between standings checks while a gameweek is live.
+        report_file (str): Where each refresh saves its run report.
+    """
+
+    def __init__(self, league_ids, jobs=1, backend=pipeline.embedding_backend, incremental=pipeline.incremental_embedding,
+                 live_interval=LIVE_INTERVAL, report_file=pipeline.run_report_file):
+        self.league_ids = list(league_ids)
+        self.jobs = jobs
+        self.backend = backend
+        self.incremental = incremental
+        self.live_interval = live_interval
+        self.report_file = report_file
+        self.status = None
+        self.standings = {}
+        self.retry = set()
+        self.last_refresh = None
+        self._executor = None
+
+    def __enter__(self):
+        self._executor = pipeline.worker_pool(self.jobs)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._executor.shutdown(cancel_futures=True)
+        self._executor = None
+
+    def changed_leagues(self, league_ids):
+        """
+        Refetches the standings of the given leagues.
+
+        Returns:
+            list: The leagues whose members or points changed since the last check,
+            and those checked for the first time.
+        """
+        changed = []
+        for league_id in league_ids:
+            managers = pipeline.fetch_all_managers(league_id, refresh=True)
+            previous = self.standings.get(league_id)
+            self.standings[league_id] = managers
+            if previous is None:
+                changed.append(league_id)
+                continue
+            changes = pipeline.compare_standings(previous, managers)
+            if changes['joined'] or changes['left'] or changes['changed']:
+                changed.append(league_id)
+        return changed
+
+    def poll(self):
+        """
+        Checks the event status once and recomputes the leagues that need it.
+
+        Returns:
+            list: The leagues recomputed, empty if nothing changed.
+        """
+        started_at = time.time()
+        metrics.reset()
+        with metrics.stage('fetch'):
+            season = pipeline.fetch_player_data()
+        _, gameweek, finished = season
+        status = (gameweek, finished)
+
+        if status != self.status:
+            if self.status is None:
+                trigger = 'start'
+            elif gameweek != self.status[0]:
+                trigger = 'gameweek_live'
+            else:
+                trigger = 'gameweek_finished'
+            with metrics.stage('fetch'):
+                self.changed_leagues(self.league_ids)
+            leagues = self.league_ids
+        elif not finished and time.monotonic() - self.last_refresh >= self.live_interval:
+            trigger = 'standings_changed'
+            with metrics.stage('fetch'):
+                leagues = sorted(set(self.changed_leagues(self.league_ids)) | self.retry)
+        elif self.retry:
+            trigger = 'retry'
+            leagues = sorted(self.retry)
+        else:
+            return []
+
+        if not leagues:
+            self.status = status
+            self.last_refresh = time.monotonic()
+            print(f"Gameweek {gameweek}: no standings changed")
+            return []
+
+        print(f"Gameweek {gameweek} ({trigger}): recomputing leagues {leagues}")
+        try:
+            with metrics.stage('fetch'):
+                pipeline.fetch_league_names(self.league_ids)
+            failed = pipeline.run_batch(leagues, 'current', jobs=self.jobs, backend=self.backend, incremental=self.incremental,
+                                        season=season, refresh_standings=False, executor=self._executor)
+        except Exception:
+            # The status is not committed, so a gameweek going live or finishing
+            # triggers again on the next poll; standings changes are retried
+            self.retry.update(leagues)
+            raise
+        self.status = status
+        self.last_refresh = time.monotonic()
+        self.retry = {league_id for league_id, _ in failed}
+        report = metrics.write_report(self.report_file, started_at, failed, extra={
+            'leagues': leagues,
+            'gameweeks': str(gameweek),
+            'jobs': self.jobs,
+            'backend': self.backend,
+            'incremental': self.incremental,
+            'trigger': trigger,
+        })
+        print(f"Run report saved to '{self.report_file}' ({report['wall_seconds']:.1f}s, peak RSS {report['peak_rss_bytes'] / 2**20:.0f} MiB)")
+        return leagues
+
+    def run(self, poll_interval=POLL_INTERVAL, stop=None):
+        """
+        Polls every `poll_interval` seconds until `stop` (a threading.Event) is set.
+
+        Errors are reported and retried on the next poll rather than ending the process.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error: refresh failed: {e.__class__.__name__}: {e}")
+            stop.wait(poll_interval)
+
+
+def main(argv=None):
+    """Command line entry point; see --help."""
+    parser = argparse.ArgumentParser(description="Keep FPL league similarity results up to date as gameweeks go live and finish.")
+    parser.add_argument('--leagues', type=int, nargs='+', default=pipeline.league_ids, help="League IDs to keep up to date (default: %(default)s)")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="Worker processes for vectorizing and embedding (default: %(default)s)")
+    parser.add_argument('--backend', choices=embedding.EMBEDDING_BACKENDS, default=pipeline.embedding_backend, help="Embedding backend (default: %(default)s)")
+    parser.add_argument('--no-incremental', dest='incremental', action='store_false', default=pipeline.incremental_embedding, help="Do not warm-start from the previous gameweek's layout")
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL, help="Seconds between event status checks (default: %(default)s)")
+    parser.add_argument('--live-interval', type=float, default=LIVE_INTERVAL, help="Seconds between standings checks while a gameweek is live (default: %(default)s)")
+    parser.add_argument('--requests-per-second', type=float, help="FPL API request rate limit (default: %s)" % api.REQUESTS_PER_SECOND)
+    parser.add_argument('--report', default=pipeline.run_report_file, help="Run report path, rewritten after every refresh (default: %(default)s)")
+    parser.add_argument('--once', action='store_true', help="Refresh once and exit")
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.requests_per_second:
+        api.configure(requests_per_second=args.requests_per_second)
+    os.makedirs(pipeline.DATA_DIRECTORY, exist_ok=True)
+    os.makedirs(pipeline.CACHE_DIRECTORY, exist_ok=True)
+
+    lock = open(lock_file, 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"Another daemon holds '{lock_file}' and keeps the results up to date, exiting")
+        return 0
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+    print(f"Serving results from '{pipeline.DATA_DIRECTORY}' for leagues {args.leagues}")
+    with RefreshDaemon(args.leagues, args.jobs, args.backend, args.incremental, args.live_interval, args.report) as daemon:
+        if args.once:
+            daemon.poll()
+            return 1 if daemon.retry else 0
+        daemon.run(args.poll_interval, stop)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
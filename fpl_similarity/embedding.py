@@ -0,0 +1,290 @@
+"""
+Pluggable 2-D embedding of the unique team vectors.
+
+Three backends are available, selected by name:
+
+* 'sklearn': scikit-learn's Barnes-Hut t-SNE (the original behaviour).
+* 'opentsne': openTSNE with FFT-accelerated gradients, which scales to far
+  larger leagues. Requires the optional openTSNE package.
+* 'umap': UMAP. Requires the optional umap-learn package.
+
+All backends run multi-threaded and start from the PCA coordinates that the
+pipeline has already computed. They differ in when they stop:
+
+* 'sklearn' runs at most MAX_ITER iterations and uses scikit-learn's own early
+  stopping: it ends once the KL divergence has not improved for
+  `n_iter_without_progress` iterations or the gradient norm falls below
+  `min_grad_norm`.
+* 'opentsne' runs at most MAX_ITER iterations and ends early once the KL
+  divergence improves by less than KL_TOLERANCE between two checks
+  (`KLConvergence`).
+* 'umap' always runs a fixed number of epochs (umap-learn's default, or a
+  shorter count when refining), whatever MAX_ITER is.
+
+Embeddings can also be warm-started from the previous gameweek's layout
+(`warm_start_layout`): teams that barely changed start where they were, new or
+heavily changed teams are placed next to their nearest neighbours, and only a
+short refinement (REFINE_ITER iterations, no early exaggeration) is run.
+"""
+import json
+import os
+
+import numpy as np
+
+EMBEDDING_BACKENDS = ('sklearn', 'opentsne', 'umap')
+DEFAULT_BACKEND = 'sklearn'
+
+MAX_ITER = 10000
+MAX_PERPLEXITY = 10
+N_JOBS = -1  # Use all cores
+
+# openTSNE stops when the KL divergence improves by less than this fraction
+# between two checks, CHECK_EVERY iterations apart
+KL_TOLERANCE = 1e-4
+CHECK_EVERY = 50
+EARLY_EXAGGERATION_ITER = 250
+
+# Standard deviation of the first initial coordinate, as used by t-SNE's own PCA initialisation
+INIT_SCALE = 1e-4
+
+# Warm starts: a team keeps its previous position if at most MAX_CHANGED_PLAYERS
+# of its players changed; other teams are placed at the mean position of their
+# NEIGHBORS nearest seeded teams. With fewer than MIN_SEEDED_FRACTION of the
+# unique teams seeded, a full embedding is run instead.
+REFINE_ITER = 500
+MAX_CHANGED_PLAYERS = 2
+NEIGHBORS = 5
+MIN_SEEDED_FRACTION = 0.5
+
+
+def scaled_initialization(pca_result):
+    """
+    Rescales PCA coordinates into a t-SNE starting layout.
+
+    Matches the scaling t-SNE applies to its own PCA initialisation, so passing
+    the pipeline's `pca_result` gives the same start without a second PCA fit.
+    """
+    init = np.asarray(pca_result, dtype=np.float64)
+    std = np.std(init[:, 0])
+    if std == 0:
+        return np.random.default_rng(0).normal(scale=INIT_SCALE, size=init.shape)
+    return init / std * INIT_SCALE
+
+
+class KLConvergence:
+    """
+    openTSNE callback that stops the optimisation once the KL divergence has converged.
+
+    Checks made during the early exaggeration phase are ignored, since the
+    divergence reported there is not comparable with the final one.
+    """
+
+    def __init__(self, tolerance=KL_TOLERANCE, check_every=CHECK_EVERY, skip_iterations=EARLY_EXAGGERATION_ITER):
+        self.tolerance = tolerance
+        self.check_every = check_every
+        self.skip_iterations = skip_iterations
+        self.iterations = 0
+        self.last_error = None
+
+    def __call__(self, iteration, error, embedding):
+        self.iterations += self.check_every
+        if self.iterations <= self.skip_iterations:
+            return False
+        converged = self.last_error is not None and self.last_error - error < self.tolerance * abs(self.last_error)
+        self.last_error = error
+        return converged
+
+
+def _embed_sklearn(vectors, init, perplexity, max_iter, n_jobs, refine):
+    from sklearn.manifold import TSNE
+
+    # sklearn's own early stopping ends the run once the KL divergence has not
+    # improved for n_iter_without_progress iterations
+    tsne = TSNE(
+        n_components=2,
+        perplexity=perplexity,
+        max_iter=max_iter,
+        init=init,
+        n_jobs=n_jobs,
+        early_exaggeration=1.0 if refine else 12.0,
+    )
+    return tsne.fit_transform(vectors)
+
+
+def _embed_opentsne(vectors, init, perplexity, max_iter, n_jobs, refine):
+    try:
+        from openTSNE import TSNE
+    except ImportError as e:
+        raise ImportError("The 'opentsne' embedding backend requires openTSNE (pip install openTSNE)") from e
+    from scipy import sparse
+
+    if sparse.issparse(vectors):
+        vectors = vectors.toarray()
+    exaggeration_iter = 0 if refine else EARLY_EXAGGERATION_ITER
+    tsne = TSNE(
+        n_components=2,
+        perplexity=perplexity,
+        early_exaggeration_iter=exaggeration_iter,
+        n_iter=max(0, max_iter - exaggeration_iter),
+        initialization=init,
+        negative_gradient_method='fft',
+        n_jobs=n_jobs,
+        callbacks=KLConvergence(skip_iterations=exaggeration_iter),
+        callbacks_every_iters=CHECK_EVERY,
+    )
+    return np.asarray(tsne.fit(vectors))
+
+
+def _embed_umap(vectors, init, perplexity, max_iter, n_jobs, refine):
+    try:
+        import umap
+    except ImportError as e:
+        raise ImportError("The 'umap' embedding backend requires umap-learn (pip install umap-learn)") from e
+
+    # UMAP's neighbourhood size plays the role of t-SNE's perplexity
+    n_neighbors = max(2, min(len(init) - 1, int(3 * perplexity)))
+    reducer = umap.UMAP(
+        n_components=2,
+        n_neighbors=n_neighbors,
+        init=init,
+        n_epochs=max(50, REFINE_ITER // 5) if refine else None,
+        n_jobs=n_jobs,
+        tqdm_kwds={'disable': True},
+    )
+    return reducer.fit_transform(vectors)
+
+
+_BACKENDS = {
+    'sklearn': _embed_sklearn,
+    'opentsne': _embed_opentsne,
+    'umap': _embed_umap,
+}
+
+
+def embed(vectors, pca_result, backend=DEFAULT_BACKEND, max_iter=MAX_ITER, n_jobs=N_JOBS, init=None, refine=False):
+    """
+    Computes 2-D embedding coordinates for the unique team vectors.
+
+    Args:
+        vectors (np.ndarray or scipy.sparse matrix): One row per unique team.
+        pca_result (np.ndarray): The 2-D PCA coordinates of the same rows, used
+            as the starting layout.
+        backend (str): One of EMBEDDING_BACKENDS.
+        max_iter (int): Upper bound on optimisation iterations.
+        n_jobs (int): Number of threads; -1 uses all cores.
+        init (np.ndarray): Starting layout to use instead of the scaled PCA coordinates.
+        refine (bool): If True, `init` is an already laid out embedding (see
+            `warm_start_layout`) and only a short refinement without early
+            exaggeration is run.
+
+    Returns:
+        np.ndarray: An (n, 2) array of coordinates.
+
+    Raises:
+        ValueError: If `backend` is not one of EMBEDDING_BACKENDS.
+        ImportError: If the backend's optional package is not installed.
+    """
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+
+    n_samples = vectors.shape[0]
+    if n_samples < 3:
+        # Too few teams for a neighbourhood embedding; the PCA layout says it all
+        return np.asarray(pca_result, dtype=np.float64)
+
+    if init is None:
+        init = scaled_initialization(pca_result)
+        refine = False
+    if refine:
+        max_iter = min(max_iter, REFINE_ITER)
+    perplexity = min(n_samples - 1, MAX_PERPLEXITY)
+    return _BACKENDS[backend](vectors, init, perplexity, max_iter, n_jobs, refine)
+
+
+def load_previous_layout(filename):
+    """
+    Loads team positions from a previous gameweek's similarity results file.
+
+    Args:
+        filename (str): Path of a fpl_team_similarity_{league}_gw{N}.json file.
+
+    Returns:
+        dict: Team ID -> (set of player IDs owned, (tsne_x, tsne_y)), or None if
+        the file does not exist.
+    """
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r') as f:
+        records = json.load(f)
+    layout = {}
+    for record in records:
+        position = (record['tsne_x'], record['tsne_y'])
+        players = set(record['players_owned'])
+        for team_id in record['team_ids']:
+            layout[team_id] = (players, position)
+    return layout
+
+
+def _squared_distances(rows, others):
+    """Returns the squared euclidean distances between the rows of two (sparse) matrices."""
+    from scipy import sparse
+
+    def squared_norms(m):
+        if sparse.issparse(m):
+            return np.asarray(m.multiply(m).sum(axis=1)).ravel()
+        return np.einsum('ij,ij->i', m, m)
+
+    products = rows @ others.T
+    if sparse.issparse(products):
+        products = products.toarray()
+    return squared_norms(rows)[:, None] + squared_norms(others)[None, :] - 2 * products
+
+
+def warm_start_layout(aggregated_data, vectors, previous_layout, chunk_size=256):
+    """
+    Builds a starting layout for the unique teams from the previous gameweek's positions.
+
+    Each unique team starts at the mean previous position of its managers whose
+    squads changed by at most MAX_CHANGED_PLAYERS players. Teams with no such
+    manager start at the mean position of their NEIGHBORS nearest seeded teams,
+    measured on the weighted team vectors.
+
+    Args:
+        aggregated_data (list): The aggregated records, one per row of `vectors`.
+        vectors (np.ndarray or scipy.sparse matrix): The unique team vectors.
+        previous_layout (dict): The output of `load_previous_layout`.
+        chunk_size (int): Number of unseeded teams handled per distance computation.
+
+    Returns:
+        np.ndarray: An (n, 2) starting layout, or None if fewer than
+        MIN_SEEDED_FRACTION of the teams could be seeded.
+    """
+    n_samples = len(aggregated_data)
+    init = np.zeros((n_samples, 2))
+    seeded = np.zeros(n_samples, dtype=bool)
+    for i, record in enumerate(aggregated_data):
+        players = set(record['players_owned'])
+        positions = []
+        for team_id in record['team_ids']:
+            previous = previous_layout.get(team_id)
+            if previous is not None and len(players - previous[0]) <= MAX_CHANGED_PLAYERS:
+                positions.append(previous[1])
+        if positions:
+            init[i] = np.mean(positions, axis=0)
+            seeded[i] = True
+
+    n_seeded = int(seeded.sum())
+    print(f"Warm start: {n_seeded} of {n_samples} unique teams seeded from the previous gameweek")
+    if n_seeded == 0 or n_seeded < MIN_SEEDED_FRACTION * n_samples:
+        return None
+
+    seeded_rows = np.flatnonzero(seeded)
+    unseeded_rows = np.flatnonzero(~seeded)
+    seeded_vectors = vectors[seeded_rows]
+    k = min(NEIGHBORS, n_seeded)
+    for start in range(0, len(unseeded_rows), chunk_size):
+        rows = unseeded_rows[start:start + chunk_size]
+        distances = _squared_distances(vectors[rows], seeded_vectors)
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        init[rows] = init[seeded_rows[nearest]].mean(axis=1)
+    return init
@@ -0,0 +1,261 @@
+"""
+Groups identical teams by a compact hash of their team signature.
+
+Two teams are identical when they have the same starting XI, the same bench
+players, the same captain and the same active chip (see the README). The
+signature hashes exactly these fields, so grouping no longer depends on
+building and comparing float vectors.
+
+`TeamGroups` groups teams as they are ingested, one at a time or a gameweek
+of columns at a time, and keeps a single copy of each distinct squad, so the
+memory held for a league grows with its number of unique teams rather than its
+number of managers.
+"""
+import hashlib
+from array import array
+
+import numpy as np
+
+from fpl_similarity import records, vectorize
+
+SIGNATURE_BYTES = 16
+
+
+def team_signature(team, captain, active_chip):
+    """
+    Returns a fixed-width key identifying a team for grouping purposes.
+
+    Args:
+        team: A list of (player_id, position) tuples representing the team.
+        captain: The player ID of the captain.
+        active_chip: The active chip for the gameweek, or None.
+
+    Returns:
+        bytes: A SIGNATURE_BYTES long BLAKE2b digest of the sorted starting XI,
+        the sorted bench, the captain and the chip.
+    """
+    starting = sorted(player_id for player_id, position in team if position <= 11)
+    bench = sorted(player_id for player_id, position in team if position > 11)
+    fields = np.array([len(starting), *starting, len(bench), *bench, captain], dtype=np.int64)
+    digest = hashlib.blake2b(fields.tobytes(), digest_size=SIGNATURE_BYTES)
+    digest.update((active_chip or '').encode('utf-8'))
+    return digest.digest()
+
+
+def _unique_rows(values):
+    """
+    Finds the distinct rows of a non-negative integer matrix.
+
+    Values below 2**16 are packed four to a word first, so sorting the rows
+    compares a few words rather than every column.
+
+    Returns:
+        tuple: The index of the first occurrence of each distinct row, and the
+        position in that array of every row's distinct row.
+    """
+    if values.max(initial=0) >= 1 << 16:
+        _, first, inverse = np.unique(values, axis=0, return_index=True, return_inverse=True)
+        return first, inverse.reshape(-1)
+    n, width = values.shape
+    padded = np.zeros((n, -(-width // 4) * 4), dtype=np.uint64)
+    padded[:, :width] = values
+    words = padded.reshape(n, -1, 4) << np.array([48, 32, 16, 0], dtype=np.uint64)
+    words = np.bitwise_or.reduce(words, axis=2)
+    order = np.lexsort(words.T[::-1])
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = (words[order[1:]] != words[order[:-1]]).any(axis=1)
+    group = np.cumsum(starts) - 1
+    inverse = np.empty(n, dtype=np.int64)
+    inverse[order] = group
+    return order[starts], inverse
+
+
+class TeamGroups:
+    """
+    Groups identical teams as they are added and aggregates their data.
+
+    Each group keeps one aggregated record (see `add`) and one copy of its
+    squad, stored in flat arrays from which `team_matrix` builds the weighted
+    vectors of the unique teams.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._group_index = {}
+        self._elements = array('q')
+        self._positions = array('b')
+        self._counts = array('q')
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def n_teams(self):
+        """The number of teams added, across all groups."""
+        return sum(record['manager_count'] for record in self.records)
+
+    def add(self, manager, team_picks):
+        """
+        Adds one team, either to the group of identical teams or as a new group.
+
+        Args:
+            manager (dict): The manager's standings entry ('name', 'team_name', 'team_id').
+            team_picks (records.TeamPicks): The manager's parsed picks.
+
+        Returns:
+            int: The index of the team's group.
+        """
+        key = team_signature(team_picks.team, team_picks.captain, team_picks.active_chip)
+        index = self._group_index.get(key)
+        if index is not None:
+            record = self.records[index]
+            record['manager_names'].append(manager['name'])
+            record['team_names'].append(manager['team_name'])
+            record['team_ids'].append(manager['team_id'])
+            record['manager_count'] += 1
+            return index
+
+        index = self._group_index[key] = len(self.records)
+        self._elements.extend(team_picks.elements)
+        self._positions.extend(team_picks.positions)
+        self._counts.append(len(team_picks.elements))
+        self.records.append({
+            'manager_names': [manager['name']],
+            'team_names': [manager['team_name']],
+            'team_ids': [manager['team_id']],
+            'manager_count': 1,
+            'captain': team_picks.captain,
+            'vice_captain': team_picks.vice_captain,
+            'total_points': team_picks.total_points,
+            'rank': team_picks.rank,
+            'gw_points': team_picks.gw_points,
+            'gw_rank': team_picks.gw_rank,
+            'active_chip': team_picks.active_chip,
+            'players_owned': list(team_picks.elements),
+        })
+        return index
+
+    def add_batch(self, managers, batch):
+        """
+        Adds a whole gameweek of teams, grouping them with column operations.
+
+        Identical rows are found with one sort over the signature fields of
+        every team, so only one signature per distinct team is hashed. The
+        groups and their records are the same as adding the teams one by one
+        with `add`, in the same order.
+
+        Args:
+            managers (list): The managers' standings entries, aligned with the batch's rows.
+            batch (records.PicksBatch): The managers' picks.
+
+        Returns:
+            np.ndarray: The group index of each row, -1 for managers without picks.
+        """
+        group_of = np.full(len(batch), -1, dtype=np.int64)
+        rows = np.flatnonzero(batch.valid)
+        if not len(rows):
+            return group_of
+        positions = batch.positions[rows].astype(np.int64)
+        starting = positions <= 11
+        if not ((positions > 0).all() and (starting.sum(axis=1) == 11).all()):
+            # Squads of unusual shapes take the one-by-one path
+            for i in rows:
+                group_of[i] = self.add(managers[i], batch.team_picks(i))
+            return group_of
+
+        # The fields hashed by team_signature, one row per team: the sorted
+        # starting XI and the sorted bench, each preceded by its size, then the captain
+        elements = batch.elements[rows].astype(np.int64)
+        by_slot = np.sort(np.where(starting, 0, 1 << 32) + elements, axis=1) & 0xFFFFFFFF
+        n = len(rows)
+        fields = np.column_stack([
+            np.full(n, 11), by_slot[:, :11],
+            np.full(n, records.SQUAD_SIZE - 11), by_slot[:, 11:],
+            batch.captains()[rows],
+        ])
+        first, inverse = _unique_rows(np.column_stack([by_slot, fields[:, -1], batch.chip_codes[rows]]))
+
+        # Unique teams in order of first appearance, their columns converted in bulk
+        order = np.argsort(first, kind='stable')
+        first_rows = rows[first[order]]
+        chips = [batch.chip_names[code] for code in batch.chip_codes[first_rows].tolist()]
+        new = []
+        unique_groups = np.empty(len(first), dtype=np.int64)
+        for u, j, active_chip in zip(order.tolist(), first[order].tolist(), chips):
+            digest = hashlib.blake2b(fields[j].tobytes(), digest_size=SIGNATURE_BYTES)
+            digest.update((active_chip or '').encode('utf-8'))
+            key = digest.digest()
+            index = self._group_index.get(key)
+            if index is None:
+                index = self._group_index[key] = len(self.records) + len(new)
+                new.append(j)
+            unique_groups[u] = index
+
+        if new:
+            i = rows[new]
+            self._elements.frombytes(elements[new].tobytes())
+            self._positions.frombytes(positions[new].astype(np.int8).tobytes())
+            self._counts.frombytes(np.full(len(new), records.SQUAD_SIZE, dtype=np.int64).tobytes())
+            columns = zip(
+                fields[new, -1].tolist(),
+                batch.vice_captains()[i].tolist(),
+                batch.total_points[i].tolist(),
+                batch.rank[i].tolist(),
+                batch.gw_points[i].tolist(),
+                batch.gw_rank[i].tolist(),
+                batch.chip_codes[i].tolist(),
+                elements[new].tolist(),
+            )
+            for captain, vice_captain, total_points, rank, gw_points, gw_rank, chip_code, players_owned in columns:
+                self.records.append({
+                    'manager_names': [],
+                    'team_names': [],
+                    'team_ids': [],
+                    'manager_count': 0,
+                    'captain': captain,
+                    'vice_captain': vice_captain,
+                    'total_points': total_points,
+                    'rank': records.optional_rank(rank),
+                    'gw_points': gw_points,
+                    'gw_rank': records.optional_rank(gw_rank),
+                    'active_chip': batch.chip_names[chip_code],
+                    'players_owned': players_owned,
+                })
+
+        group_of[rows] = unique_groups[inverse.reshape(-1)]
+        for i, group in zip(rows.tolist(), group_of[rows].tolist()):
+            manager = managers[i]
+            record = self.records[group]
+            record['manager_names'].append(manager['name'])
+            record['team_names'].append(manager['team_name'])
+            record['team_ids'].append(manager['team_id'])
+            record['manager_count'] += 1
+        return group_of
+
+    def squads(self):
+        """
+        Returns the squad of every group as flat arrays.
+
+        Returns:
+            tuple: (elements, positions, counts) as returned by vectorize.flatten_teams.
+        """
+        return (
+            np.frombuffer(self._elements, dtype=np.int64).copy(),
+            np.frombuffer(self._positions, dtype=np.int8).astype(np.int64),
+            np.frombuffer(self._counts, dtype=np.int64).copy(),
+        )
+
+    def team_matrix(self, player_prices):
+        """
+        Builds the weighted vector of every group's team.
+
+        Returns:
+            tuple: One row per group, as returned by vectorize.build_team_matrix.
+        """
+        elements, positions, counts = self.squads()
+        return vectorize.weighted_matrix(
+            elements, positions, counts,
+            [record['captain'] for record in self.records],
+            [record['active_chip'] for record in self.records],
+            player_prices,
+        )
@@ -0,0 +1,315 @@
+"""
+Append-only, memory-mapped history of every league's teams across the season.
+
+Each league has a directory of .npy files, opened with numpy memory maps and
+laid out gameweek-major with one slot per gameweek of the season:
+
+    teams.npy         (capacity,)                 team ID of each team slot
+    squads.npy        (MAX_GAMEWEEKS, capacity, 15) player IDs in squad position order
+    captains.npy      (MAX_GAMEWEEKS, capacity)   captain player ID
+    vice_captains.npy (MAX_GAMEWEEKS, capacity)   vice-captain player ID
+    chips.npy         (MAX_GAMEWEEKS, capacity)   chip code, see 'chips' in history.json
+    gw_points.npy     (MAX_GAMEWEEKS, capacity)   gameweek points (transfer cost subtracted)
+    total_points.npy  (MAX_GAMEWEEKS, capacity)   total points after the gameweek
+    coordinates.npy   (MAX_GAMEWEEKS, capacity, 2) t-SNE coordinates of the team's group
+    present.npy       (MAX_GAMEWEEKS, capacity)   whether the team has a row for the gameweek
+
+history.json records the number of teams used, the capacity, the chip codes
+and the gameweeks written. The pipeline appends each (league, gameweek) it
+processes. Reading a value is an O(1) index into the maps, and a whole season
+of a team or of the league is a zero-copy slice, e.g.
+`history.coordinates[:, history.team_slot(team_id)]`. Team slots are
+appended as managers join and never move. When the capacity is reached, the
+arrays are copied to files of double the size.
+
+Writers of the same league take an exclusive lock on the directory's lock
+file, so pipeline worker processes can append different gameweeks at once.
+"""
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from fpl_similarity import output, records
+
+HISTORY_FORMAT = 'fpl-similarity-history'
+HISTORY_VERSION = 1
+
+MAX_GAMEWEEKS = 38
+
+# Team slots allocated when a league's history is created; doubled when full
+INITIAL_CAPACITY = 1024
+
+# Name -> (dtype, shape after the gameweek and team axes, fill value)
+COLUMNS = {
+    'squads': (np.int16, (records.SQUAD_SIZE,), 0),
+    'captains': (np.int16, (), 0),
+    'vice_captains': (np.int16, (), 0),
+    'chips': (np.int8, (), 0),
+    'gw_points': (np.int32, (), 0),
+    'total_points': (np.int32, (), 0),
+    'coordinates': (np.float32, (2,), np.nan),
+    'present': (np.bool_, (), False),
+}
+
+
+def league_directory(directory, league_id):
+    """Returns the directory holding a league's history."""
+    return os.path.join(directory, str(league_id))
+
+
+class LeagueHistory:
+    """
+    The memory-mapped history of one league.
+
+    Use `open_history` to open one. The column maps (see COLUMNS) are
+    attributes, sliced to the teams used so far.
+
+    Args:
+        path (str): The league's history directory.
+        writable (bool): Open the maps for writing; `append` requires it.
+    """
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        with open(os.path.join(path, 'history.json'), 'r') as f:
+            self.metadata = json.load(f)
+        self._team_slots = None
+        self._map()
+
+    def _map(self):
+        mode = 'r+' if self.writable else 'r'
+        n_teams = self.metadata['teams']
+        self._maps = {name: np.load(self._file(name), mmap_mode=mode) for name in ('teams', *COLUMNS)}
+        self.team_ids = self._maps['teams'][:n_teams]
+        for name in COLUMNS:
+            setattr(self, name, self._maps[name][:, :n_teams])
+
+    def _file(self, name):
+        return os.path.join(self.path, f'{name}.npy')
+
+    @property
+    def gameweeks(self):
+        """The gameweeks appended so far, in ascending order."""
+        return sorted(self.metadata['gameweeks'])
+
+    @property
+    def chip_names(self):
+        """The chip of each chip code, None first."""
+        return [name or None for name in self.metadata['chips']]
+
+    def team_slot(self, team_id):
+        """Returns the team axis index of a team, or None if it never appeared."""
+        if self._team_slots is None:
+            self._team_slots = {team_id: slot for slot, team_id in enumerate(self.team_ids.tolist())}
+        return self._team_slots.get(team_id)
+
+    def trajectory(self, team_id):
+        """
+        Returns a team's t-SNE coordinates for every gameweek of the season.
+
+        Returns:
+            np.ndarray: A (MAX_GAMEWEEKS, 2) view, NaN for gameweeks without a row.
+
+        Raises:
+            KeyError: If the team never appeared in the league.
+        """
+        slot = self.team_slot(team_id)
+        if slot is None:
+            raise KeyError(team_id)
+        return self.coordinates[:, slot]
+
+    def drift(self, start, end):
+        """
+        Measures how far every team moved between two gameweeks.
+
+        Args:
+            start (int): The first gameweek.
+            end (int): The second gameweek.
+
+        Returns:
+            dict: For the teams present in both gameweeks, 'team_ids', the
+            number of squad players replaced ('transfers') and the distance
+            between their t-SNE coordinates ('distance').
+        """
+        both = self.present[start - 1] & self.present[end - 1]
+        before = np.sort(self.squads[start - 1][both], axis=1)
+        after = np.sort(self.squads[end - 1][both], axis=1)
+        kept = (before[:, :, None] == after[:, None, :]).any(axis=2).sum(axis=1)
+        distance = np.linalg.norm(self.coordinates[end - 1][both] - self.coordinates[start - 1][both], axis=1)
+        return {
+            'team_ids': self.team_ids[both],
+            'transfers': records.SQUAD_SIZE - kept,
+            'distance': distance,
+        }
+
+    def ownership(self, gameweek):
+        """
+        Returns the share of the gameweek's teams owning each player.
+
+        Returns:
+            tuple: (player IDs, shares in [0, 1]), in ascending player ID order.
+        """
+        squads = self.squads[gameweek - 1][self.present[gameweek - 1]]
+        if not len(squads):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        player_ids, counts = np.unique(squads[squads > 0], return_counts=True)
+        return player_ids, counts / len(squads)
+
+    def append(self, gameweek, managers, batch, group_of, coordinates):
+        """
+        Writes one gameweek of the league, replacing any earlier rows of that gameweek.
+
+        Args:
+            gameweek (int): The gameweek number.
+            managers (list): The league's manager dictionaries, aligned with the batch.
+            batch (records.PicksBatch): The managers' picks.
+            group_of (np.ndarray): The group of each batch row, -1 without picks
+                (see grouping.TeamGroups.add_batch).
+            coordinates (np.ndarray): The t-SNE coordinates of each group.
+        """
+        if not 1 <= gameweek <= MAX_GAMEWEEKS:
+            raise ValueError(f"Gameweek must be between 1 and {MAX_GAMEWEEKS}, got {gameweek}")
+        if not self.writable:
+            raise ValueError("The history was opened read-only")
+        rows = np.flatnonzero(group_of >= 0)
+        if len(rows) and batch.elements[rows].max() > np.iinfo(np.int16).max:
+            raise ValueError("Player IDs do not fit the history's int16 squads")
+
+        slots = np.array([self._slot(managers[i]['team_id']) for i in rows], dtype=np.intp)
+        self._map()  # The team axis views end at the teams used before this gameweek
+        week = gameweek - 1
+
+        # Squads in squad position order, so the positions are implicit
+        order = np.argsort(np.where(batch.positions[rows] > 0, batch.positions[rows], records.SQUAD_SIZE + 1), axis=1, kind='stable')
+        squads = np.take_along_axis(batch.elements[rows], order, axis=1)
+
+        chip_codes = self._chip_codes(batch.chip_names)
+        columns = {
+            'squads': squads,
+            'captains': batch.captains()[rows],
+            'vice_captains': batch.vice_captains()[rows],
+            'chips': chip_codes[batch.chip_codes[rows]],
+            'gw_points': batch.gw_points[rows],
+            'total_points': batch.total_points[rows],
+            'coordinates': np.asarray(coordinates, dtype=np.float32)[group_of[rows]],
+            'present': True,
+        }
+        for name, (dtype, shape, fill) in COLUMNS.items():
+            column = self._maps[name]
+            column[week] = fill
+            column[week, slots] = columns[name]
+            column.flush()
+
+        self.metadata['gameweeks'] = sorted(set(self.metadata['gameweeks']) | {gameweek})
+        self._save_metadata()
+
+    def _slot(self, team_id):
+        slot = self.team_slot(team_id)
+        if slot is not None:
+            return slot
+        slot = self.metadata['teams']
+        if slot == self.metadata['capacity']:
+            self._grow()
+        self._maps['teams'][slot] = team_id
+        self.metadata['teams'] = slot + 1
+        self._team_slots[team_id] = slot
+        return slot
+
+    def _grow(self):
+        """Copies the arrays to files with double the team capacity."""
+        capacity = self.metadata['capacity'] * 2
+        for name, old in self._maps.items():
+            shape = (capacity,) if name == 'teams' else (MAX_GAMEWEEKS, capacity, *old.shape[2:])
+            fill = 0 if name == 'teams' else COLUMNS[name][2]
+            tmp_path = f'{self._file(name)}.tmp'
+            new = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=old.dtype, shape=shape)
+            new[...] = fill
+            if name == 'teams':
+                new[:len(old)] = old
+            else:
+                new[:, :old.shape[1]] = old
+            new.flush()
+            del new
+            os.replace(tmp_path, self._file(name))
+        self.metadata['capacity'] = capacity
+        self._map()
+
+    def _chip_codes(self, chip_names):
+        """Maps a batch's chip codes to the history's, adding new chips."""
+        known = self.metadata['chips']
+        codes = []
+        for name in chip_names:
+            name = name or ''
+            if name not in known:
+                known.append(name)
+            codes.append(known.index(name))
+        if len(known) > np.iinfo(np.int8).max:
+            raise ValueError("Too many distinct chips for the history's int8 codes")
+        return np.array(codes, dtype=np.int8)
+
+    def _save_metadata(self):
+        self._maps['teams'].flush()
+        content = json.dumps(self.metadata).encode('utf-8')
+        output.write_atomic(os.path.join(self.path, 'history.json'), content, compress=False)
+
+
+def _create(path):
+    """Creates the empty arrays and metadata of a league's history."""
+    os.makedirs(path, exist_ok=True)
+    np.lib.format.open_memmap(os.path.join(path, 'teams.npy'), mode='w+', dtype=np.int64, shape=(INITIAL_CAPACITY,)).flush()
+    for name, (dtype, shape, fill) in COLUMNS.items():
+        column = np.lib.format.open_memmap(os.path.join(path, f'{name}.npy'), mode='w+', dtype=dtype,
+                                           shape=(MAX_GAMEWEEKS, INITIAL_CAPACITY, *shape))
+        column[...] = fill
+        column.flush()
+    metadata = {
+        'format': HISTORY_FORMAT,
+        'version': HISTORY_VERSION,
+        'teams': 0,
+        'capacity': INITIAL_CAPACITY,
+        'chips': [''],
+        'gameweeks': [],
+    }
+    output.write_atomic(os.path.join(path, 'history.json'), json.dumps(metadata).encode('utf-8'), compress=False)
+
+
+@contextmanager
+def _locked(path):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'history.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def open_history(directory, league_id):
+    """
+    Opens a league's history for reading.
+
+    Returns:
+        LeagueHistory: The history, or None if nothing was recorded for the league.
+    """
+    path = league_directory(directory, league_id)
+    if not os.path.exists(os.path.join(path, 'history.json')):
+        return None
+    return LeagueHistory(path)
+
+
+def append_gameweek(directory, league_id, gameweek, managers, batch, group_of, coordinates):
+    """
+    Appends one gameweek to a league's history, creating the history on first use.
+
+    Takes the league's lock, so concurrent appends to the same league are serialized.
+    See LeagueHistory.append for the arguments.
+    """
+    path = league_directory(directory, league_id)
+    with _locked(path):
+        if not os.path.exists(os.path.join(path, 'history.json')):
+            _create(path)
+        LeagueHistory(path, writable=True).append(gameweek, managers, batch, group_of, coordinates)
@@ -0,0 +1,241 @@
+"""
+Run instrumentation: stage timings, counters, latency histograms and a run report.
+
+The pipeline records into one process-wide registry:
+
+* `stage(name)`: a context manager adding the wall and CPU time of a block to
+  the named stage. Times are summed over calls, so stages that run
+  concurrently (fetching on threads, processing in workers) can overlap.
+* `increment(name, value)`: a counter, e.g. API requests or cache hits.
+* `observe(name, value)`: a histogram with LATENCY_BUCKETS bucket bounds.
+
+Worker processes start from an empty registry and send theirs back with
+`snapshot()`, which the parent adds to its own with `merge()`, keeping the
+largest peak RSS seen in any of them.
+
+`write_report` saves the registry, the peak RSS and the run's wall time as
+JSON and in the Prometheus textfile format (for node_exporter's textfile
+collector), and appends the JSON to a history file so that runs can be
+compared. `profiled` wraps a block in cProfile; for sampling profiles of a
+whole run, run the pipeline under `py-spy record` instead.
+"""
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+REPORT_FORMAT = 'fpl-similarity-run-report'
+REPORT_VERSION = 1
+
+PROMETHEUS_PREFIX = 'fpl_similarity'
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_histograms = {}
+# Largest peak RSS of the worker snapshots merged into the registry
+_merged_peak_rss_bytes = 0
+
+
+def _empty_histogram():
+    return {'buckets': list(LATENCY_BUCKETS), 'counts': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+
+
+@contextmanager
+def stage(name):
+    """Adds the wall and CPU time spent in the block to the stage `name`."""
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        with _lock:
+            entry = _stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            entry['calls'] += 1
+            entry['wall_seconds'] += wall
+            entry['cpu_seconds'] += cpu
+
+
+def increment(name, value=1):
+    """Adds `value` to the counter `name`."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value):
+    """Records one observation, in seconds, in the histogram `name`."""
+    with _lock:
+        histogram = _histograms.setdefault(name, _empty_histogram())
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and value > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        histogram['counts'][bucket] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def snapshot():
+    """Returns a copy of the registry that can be pickled or saved as JSON."""
+    with _lock:
+        return {
+            'stages': {name: dict(entry) for name, entry in _stages.items()},
+            'counters': dict(_counters),
+            'histograms': {name: {**h, 'counts': list(h['counts'])} for name, h in _histograms.items()},
+            'peak_rss_bytes': peak_rss_bytes(),
+        }
+
+
+def merge(other):
+    """Adds a snapshot taken in another process to the registry."""
+    global _merged_peak_rss_bytes
+    with _lock:
+        _merged_peak_rss_bytes = max(_merged_peak_rss_bytes, other.get('peak_rss_bytes', 0))
+        for name, entry in other['stages'].items():
+            mine = _stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            for key in mine:
+                mine[key] += entry[key]
+        for name, value in other['counters'].items():
+            _counters[name] = _counters.get(name, 0) + value
+        for name, histogram in other['histograms'].items():
+            mine = _histograms.setdefault(name, _empty_histogram())
+            mine['counts'] = [a + b for a, b in zip(mine['counts'], histogram['counts'])]
+            mine['sum'] += histogram['sum']
+            mine['count'] += histogram['count']
+
+
+def reset():
+    """Empties the registry."""
+    global _merged_peak_rss_bytes
+    with _lock:
+        _merged_peak_rss_bytes = 0
+        _stages.clear()
+        _counters.clear()
+        _histograms.clear()
+
+
+def peak_rss_bytes():
+    """
+    Returns the peak resident set size of this process, its finished children or the merged worker snapshots.
+
+    Pool workers started by a fork server are not children of this process, so
+    their peak only arrives through `merge`.
+    """
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in KiB on Linux
+    return max(
+        scale * resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        scale * resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        _merged_peak_rss_bytes,
+    )
+
+
+def _prometheus_text(report):
+    """Formats a report in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        name = f'{PROMETHEUS_PREFIX}_{name}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+            lines.append(f'{name}{suffix}{{{label_text}}} {value}' if label_text else f'{name}{suffix} {value}')
+
+    stages = report['stages']
+    metric('stage_wall_seconds', 'gauge', 'Wall time spent in each pipeline stage.',
+           [('', {'stage': name}, entry['wall_seconds']) for name, entry in stages.items()])
+    metric('stage_cpu_seconds', 'gauge', 'CPU time spent in each pipeline stage.',
+           [('', {'stage': name}, entry['cpu_seconds']) for name, entry in stages.items()])
+    metric('stage_calls', 'gauge', 'Number of times each pipeline stage ran.',
+           [('', {'stage': name}, entry['calls']) for name, entry in stages.items()])
+    for name, value in sorted(report['counters'].items()):
+        metric(f'{name}_total', 'counter', f'Run counter {name}.', [('', {}, value)])
+    for name, histogram in sorted(report['histograms'].items()):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(histogram['buckets'] + ['+Inf'], histogram['counts']):
+            cumulative += count
+            samples.append(('_bucket', {'le': bound}, cumulative))
+        samples.append(('_sum', {}, histogram['sum']))
+        samples.append(('_count', {}, histogram['count']))
+        metric(name, 'histogram', f'Distribution of {name}.', samples)
+    metric('peak_rss_bytes', 'gauge', 'Peak resident set size of the run.', [('', {}, report['peak_rss_bytes'])])
+    metric('run_wall_seconds', 'gauge', 'Wall time of the whole run.', [('', {}, report['wall_seconds'])])
+    metric('run_failed_jobs', 'gauge', 'League/gameweek jobs that failed.', [('', {}, len(report['failed']))])
+    metric('run_finished_timestamp_seconds', 'gauge', 'Unix time at which the run finished.', [('', {}, report['finished_at'])])
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(filename, started_at, failed=(), extra=None):
+    """
+    Saves the registry as a run report.
+
+    Writes `filename` (JSON), the same path with a `.prom` extension (Prometheus
+    textfile format), and appends the JSON as one line to the same path with a
+    `.history.jsonl` extension.
+
+    Args:
+        filename (str): The JSON report path.
+        started_at (float): The Unix time at which the run started.
+        failed (iterable): The (league_id, gameweek) jobs that failed.
+        extra (dict): Run parameters to include, e.g. the leagues and gameweeks.
+
+    Returns:
+        dict: The report.
+    """
+    finished_at = time.time()
+    report = {
+        'format': REPORT_FORMAT,
+        'version': REPORT_VERSION,
+        'started_at': started_at,
+        'finished_at': finished_at,
+        'wall_seconds': finished_at - started_at,
+        'failed': [list(job) for job in failed],
+        'run': extra or {},
+        **snapshot(),
+    }
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    base, _ = os.path.splitext(filename)
+
+    # Written through a uniquely named temporary file, so a scraper never reads a
+    # partial report and two runs writing the same report never share one
+    for path, content in ((filename, json.dumps(report, indent=2)), (f'{base}.prom', _prometheus_text(report))):
+        fd, tmp_path = tempfile.mkstemp(dir=directory or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                os.fchmod(f.fileno(), 0o644)
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    with open(f'{base}.history.jsonl', 'a') as f:
+        f.write(json.dumps(report, separators=(',', ':')) + '\n')
+    return report
+
+
+@contextmanager
+def profiled(filename):
+    """Profiles the block with cProfile and saves the stats to `filename` (if not None)."""
+    if filename is None:
+        yield
+        return
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(filename)
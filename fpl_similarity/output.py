@@ -0,0 +1,206 @@
+"""
+Writers for the similarity results files served to the frontend.
+
+Two formats are written for every league and gameweek:
+
+* fpl_team_similarity_{league}_gw{N}.json: one record per group of identical
+  teams, as before, but minified.
+* fpl_team_similarity_{league}_gw{N}.columns.json: the same data stored by
+  column. Manager names, team names and chips are dictionary-encoded, the
+  per-group lists (team IDs, names, players owned) are flattened into integer
+  arrays with offsets, and coordinates are rounded to float32 precision.
+
+Both are also written gzip-precompressed (`.gz`) so the server can send them
+without compressing on every request. All files are written atomically.
+"""
+import gzip
+import json
+import os
+import tempfile
+
+from fpl_similarity import metrics
+
+# mkstemp creates files readable by their owner only; results are served by another process
+TEMPORARY_FILE_MODE = 0o644
+
+COLUMNS_FORMAT = 'fpl-similarity-columns'
+COLUMNS_VERSION = 1
+
+# Decimal places kept for coordinates in the records file (pandas' default precision)
+RECORD_DIGITS = 10
+# Significant digits kept for coordinates in the columnar file (float32 precision)
+COLUMN_SIGNIFICANT_DIGITS = 7
+
+COORDINATE_FIELDS = ('pca_x', 'pca_y', 'tsne_x', 'tsne_y')
+INTEGER_FIELDS = ('captain', 'vice_captain', 'total_points', 'rank', 'gw_points', 'gw_rank')
+LIST_FIELDS = ('manager_names', 'team_names', 'team_ids')
+
+
+def columns_filename(filename):
+    """Returns the columnar results filename that goes with a records filename."""
+    base, _ = os.path.splitext(filename)
+    return f'{base}.columns.json'
+
+
+def write_atomic(filename, content, compress=True):
+    """
+    Writes bytes to a file atomically, optionally with a gzip-compressed copy next to it.
+
+    The content goes to a uniquely named temporary file that then replaces
+    `filename`, so readers never see a partially written file and concurrent
+    writers (the daemon and the service) never share a temporary file.
+
+    Args:
+        filename (str): The destination path.
+        content (bytes): The content to write.
+        compress (bool): Also write `filename + '.gz'`.
+
+    Returns:
+        int: The number of bytes written, including the compressed copy.
+    """
+    outputs = [(filename, content)]
+    if compress:
+        outputs.append((f'{filename}.gz', gzip.compress(content, compresslevel=9, mtime=0)))
+    written = 0
+    for path, data in outputs:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                os.fchmod(f.fileno(), TEMPORARY_FILE_MODE)
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        written += len(data)
+    metrics.increment('bytes_written', written)
+    return written
+
+
+def _plain(value):
+    """Converts NumPy scalars to the equivalent Python values for json."""
+    return value.item() if hasattr(value, 'item') else value
+
+
+def encode_records(aggregated_data):
+    """
+    Encodes the aggregated records as minified JSON.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON array.
+    """
+    records = []
+    for record in aggregated_data:
+        record = {key: _plain(value) for key, value in record.items()}
+        for field in COORDINATE_FIELDS:
+            record[field] = round(float(record[field]), RECORD_DIGITS)
+        records.append(record)
+    return json.dumps(records, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def encode_columns(aggregated_data):
+    """
+    Encodes the aggregated records in the columnar format described above.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON object.
+    """
+    def dictionary_encode(values, dictionary, index):
+        codes = []
+        for value in values:
+            if value not in index:
+                index[value] = len(dictionary)
+                dictionary.append(value)
+            codes.append(index[value])
+        return codes
+
+    manager_names, manager_name_index = [], {}
+    team_names, team_name_index = [], {}
+    chips, chip_index = [], {}
+    columns = {
+        'team_offsets': [0],
+        'team_ids': [],
+        'manager_names': [],
+        'team_names': [],
+        'player_offsets': [0],
+        'players_owned': [],
+        'active_chip': [],
+    }
+    for field in INTEGER_FIELDS + COORDINATE_FIELDS:
+        columns[field] = []
+
+    for record in aggregated_data:
+        columns['team_ids'].extend(_plain(team_id) for team_id in record['team_ids'])
+        columns['manager_names'].extend(dictionary_encode(record['manager_names'], manager_names, manager_name_index))
+        columns['team_names'].extend(dictionary_encode(record['team_names'], team_names, team_name_index))
+        columns['team_offsets'].append(len(columns['team_ids']))
+        columns['players_owned'].extend(_plain(player_id) for player_id in record['players_owned'])
+        columns['player_offsets'].append(len(columns['players_owned']))
+        chip = record['active_chip']
+        columns['active_chip'].append(-1 if chip is None else dictionary_encode([chip], chips, chip_index)[0])
+        for field in INTEGER_FIELDS:
+            columns[field].append(_plain(record[field]))
+        for field in COORDINATE_FIELDS:
+            columns[field].append(float(f'{float(record[field]):.{COLUMN_SIGNIFICANT_DIGITS}g}'))
+
+    data = {
+        'format': COLUMNS_FORMAT,
+        'version': COLUMNS_VERSION,
+        'groups': len(aggregated_data),
+        'dictionaries': {
+            'manager_names': manager_names,
+            'team_names': team_names,
+            'active_chip': chips,
+        },
+        'columns': columns,
+    }
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def decode_columns(data):
+    """
+    Decodes a parsed columnar results file back into aggregated records.
+
+    Args:
+        data (dict): The parsed contents of a `.columns.json` file.
+
+    Returns:
+        list: One record per group, as in the records file.
+    """
+    dictionaries = data['dictionaries']
+    columns = data['columns']
+    records = []
+    for i in range(data['groups']):
+        start, end = columns['team_offsets'][i], columns['team_offsets'][i + 1]
+        chip = columns['active_chip'][i]
+        record = {
+            'manager_names': [dictionaries['manager_names'][code] for code in columns['manager_names'][start:end]],
+            'team_names': [dictionaries['team_names'][code] for code in columns['team_names'][start:end]],
+            'team_ids': columns['team_ids'][start:end],
+            'manager_count': end - start,
+        }
+        for field in INTEGER_FIELDS:
+            record[field] = columns[field][i]
+        record['active_chip'] = None if chip < 0 else dictionaries['active_chip'][chip]
+        record['players_owned'] = columns['players_owned'][columns['player_offsets'][i]:columns['player_offsets'][i + 1]]
+        for field in COORDINATE_FIELDS:
+            record[field] = columns[field][i]
+        records.append(record)
+    return records
+
+
+def write_results(aggregated_data, filename, compress=True):
+    """
+    Writes the records file and the columnar file for one league and gameweek.
+
+    Args:
+        aggregated_data (list): The aggregated records, with coordinates.
+        filename (str): The records filename; the columnar file goes next to it.
+        compress (bool): Also write gzip-precompressed copies.
+
+    Returns:
+        int: The total number of bytes written.
+    """
+    written = write_atomic(filename, encode_records(aggregated_data), compress)
+    written += write_atomic(columns_filename(filename), encode_columns(aggregated_data), compress)
+    return written
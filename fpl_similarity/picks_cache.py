@@ -0,0 +1,181 @@
+"""
+Per-entry cache of team picks responses, backed by SQLite.
+
+Each picks response is stored under its (team_id, gameweek) key, so lookups
+do not depend on the size of the cache, a team that appears in several leagues
+is fetched and stored once, and every response is persisted as soon as it
+arrives. An interrupted fetch therefore resumes from where it stopped.
+
+Rows can also carry a standings fingerprint: the manager's standings fields at
+the time the picks were fetched. Comparing it with the current standings tells
+whether the cached response can still be up to date.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Number of rows written between commits while a fetch is running
+COMMIT_EVERY = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS picks (
+    team_id INTEGER NOT NULL,
+    gameweek INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    fetched_after_finished INTEGER NOT NULL DEFAULT 0,
+    fetched_at REAL NOT NULL,
+    fingerprint TEXT,
+    PRIMARY KEY (team_id, gameweek)
+) WITHOUT ROWID;
+"""
+
+
+class CachedPicks:
+    """A cached picks response with the metadata stored alongside it."""
+
+    __slots__ = ('payload', 'fetched_after_finished', 'fingerprint')
+
+    def __init__(self, payload, fetched_after_finished, fingerprint):
+        self.payload = payload
+        self.fetched_after_finished = fetched_after_finished
+        self.fingerprint = fingerprint
+
+
+class PicksCache:
+    """
+    SQLite store of picks responses keyed by (team_id, gameweek).
+
+    Payloads are stored as zlib-compressed JSON. Each row also records whether
+    it was fetched after its gameweek had finished, which is what decides if
+    a cached response for the current gameweek is final.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        # Caches created before fingerprints were stored lack the column
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(picks)')}
+        if 'fingerprint' not in columns:
+            self._conn.execute('ALTER TABLE picks ADD COLUMN fingerprint TEXT')
+        self._conn.commit()
+
+    def get_entries(self, team_ids, gameweek, parse=None):
+        """
+        Looks up the cached picks and their metadata for several teams in one gameweek.
+
+        Args:
+            team_ids (iterable): The team IDs to look up.
+            gameweek (int): The gameweek number.
+            parse (callable): If given, applied to each picks response as it is
+                decoded; its result is stored as the entry's payload instead, so
+                the decoded JSON is not all held at once.
+
+        Returns:
+            dict: Team ID -> CachedPicks, for the teams found in the cache.
+        """
+        team_ids = list(team_ids)
+        found = {}
+        query = 'SELECT team_id, payload, fetched_after_finished, fingerprint FROM picks WHERE gameweek = ? AND team_id IN ({})'
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(team_ids), 500):
+                chunk = team_ids[start:start + 500]
+                rows = self._conn.execute(query.format(','.join('?' * len(chunk))), [gameweek, *chunk])
+                for team_id, payload, fetched_after_finished, fingerprint in rows:
+                    payload = json.loads(zlib.decompress(payload))
+                    if parse is not None:
+                        payload = parse(payload)
+                    found[team_id] = CachedPicks(payload, bool(fetched_after_finished), fingerprint)
+        return found
+
+    def get_many(self, team_ids, gameweek, require_finished=False, parse=None):
+        """
+        Looks up the cached picks for several teams in one gameweek.
+
+        Args:
+            team_ids (iterable): The team IDs to look up.
+            gameweek (int): The gameweek number.
+            require_finished (bool): If True, only return rows that were fetched
+                after the gameweek had finished.
+            parse (callable): Applied to each picks response, see get_entries.
+
+        Returns:
+            dict: Team ID -> picks response (or its parsed form), for the teams
+            found in the cache.
+        """
+        return {
+            team_id: entry.payload
+            for team_id, entry in self.get_entries(team_ids, gameweek, parse).items()
+            if entry.fetched_after_finished or not require_finished
+        }
+
+    def get(self, team_id, gameweek, require_finished=False):
+        """Returns the cached picks response for one team and gameweek, or None."""
+        return self.get_many([team_id], gameweek, require_finished).get(team_id)
+
+    def put(self, team_id, gameweek, payload, fetched_after_finished=False, fingerprint=None):
+        """
+        Stores one picks response, replacing any existing row for the same key.
+
+        Writes are committed every COMMIT_EVERY rows; call `flush` to commit the rest.
+        """
+        blob = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO picks (team_id, gameweek, payload, fetched_after_finished, fetched_at, fingerprint) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (team_id, gameweek, blob, int(bool(fetched_after_finished)), time.time(), fingerprint),
+            )
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def mark_finished(self, team_ids, gameweek):
+        """
+        Flags cached rows as final without refetching them.
+
+        Used for teams whose standings did not change between the fetch and the
+        end of the gameweek, so their cached response is already final.
+        """
+        with self._lock:
+            self._conn.executemany(
+                'UPDATE picks SET fetched_after_finished = 1 WHERE team_id = ? AND gameweek = ?',
+                [(team_id, gameweek) for team_id in team_ids],
+            )
+            self._conn.commit()
+            self._pending = 0
+
+    def flush(self):
+        """Commits any rows written since the last commit."""
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        """Commits pending rows and closes the database."""
+        self.flush()
+        self._conn.close()
+
+
+_open_caches = {}
+_open_caches_lock = threading.Lock()
+
+
+def open_cache(path):
+    """Returns the PicksCache for `path`, opening it on first use."""
+    with _open_caches_lock:
+        if path not in _open_caches:
+            _open_caches[path] = PicksCache(path)
+        return _open_caches[path]
@@ -0,0 +1,824 @@
+"""
+The FPL league similarity pipeline: fetch picks, vectorize, group, embed, write.
+
+Importing this module has no side effects and stays cheap: scikit-learn is only
+imported by the step that uses it, pandas and matplotlib only for the optional
+plots, and SciPy only when a team matrix is first built. Run it with `main()`, the `fpl-similarity`
+console script or `python analysis.py`. benchmarks/startup_time.py checks the
+startup time against its target.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import requests
+
+from fpl_similarity import api, embedding, grouping, history, metrics, output, picks_cache, players, records, similarity_index, vectorize
+
+# Define the data directory for saving data and graphs. server.js serves the
+# same directory when FPL_DATA_DIRECTORY is set for both (see fpl_similarity/daemon.py).
+DATA_DIRECTORY = os.environ.get('FPL_DATA_DIRECTORY', './src/assets')
+
+# Define the cache directory for storing fetched data
+CACHE_DIRECTORY = './cache'
+
+# Main execution
+# league_ids = [7639, 8497]
+league_ids = [36590]
+# league_ids = [8497]
+
+make_plots = False
+
+# Embedding used for the tsne_x/tsne_y coordinates: 'sklearn', 'opentsne' or 'umap'
+embedding_backend = embedding.DEFAULT_BACKEND
+
+# Warm-start each gameweek's embedding from the previous gameweek's layout
+incremental_embedding = True
+
+# Where each run saves its timings and counters (see fpl_similarity/metrics.py)
+run_report_file = f'{CACHE_DIRECTORY}/run_report.json'
+
+# Player prices of each gameweek (see fpl_similarity/players.py)
+price_history_file = f'{CACHE_DIRECTORY}/player_prices.npz'
+
+# Where every league's season history is appended (see fpl_similarity/history.py); None to disable
+history_directory = f'{CACHE_DIRECTORY}/history'
+
+# Where each league's managers are cached, one file per league (see managers_filename)
+managers_directory = f'{CACHE_DIRECTORY}/managers'
+
+def fetch_player_data(json_file=f'{DATA_DIRECTORY}/player_data.json', prices_file=price_history_file):
+    """
+    Fetches the player data from the Fantasy Premier League API and saves it as a JSON file.
+
+    bootstrap-static is requested conditionally and only parsed when it changed
+    (see fpl_similarity/players.py). The prices are saved as the current
+    gameweek's price snapshot, if it has none yet.
+
+    Args:
+        json_file (str): The filename for the JSON file. Defaults to 'player_data.json'.
+        prices_file (str): The price history file.
+
+    Returns:
+        tuple: A tuple containing three elements:
+            - dict: Player data with player IDs as keys and dictionaries of player info as values.
+            - int: The current gameweek number.
+            - bool: Whether the current gameweek has finished.
+
+    Raises:
+        requests.RequestException: If there's an error fetching data from the API.
+        json.JSONDecodeError: If there's an error parsing the API response.
+        IOError: If there's an error writing to the JSON file.
+    """
+    player_data, current_gameweek, current_gameweek_finished, changed = players.refresh(json_file)
+    if changed:
+        print(f"Player data and current gameweek saved to {json_file}")
+    else:
+        print(f"Player data unchanged, reusing {json_file}")
+
+    if players.PriceHistory(prices_file).record(current_gameweek, player_data):
+        print(f"Saved the gameweek {current_gameweek} price snapshot")
+
+    return player_data, current_gameweek, current_gameweek_finished
+
+def league_standings_url(league_id, page=1):
+    """Returns the URL of one page of a league's standings."""
+    return f"https://fantasy.premierleague.com/api/leagues-classic/{league_id}/standings/?page_standings={page}&page_new_entries={page}"
+
+def fetch_league_standings(league_id, page=1):
+    """
+    Fetches league standings for a given league ID and page number.
+
+    Args:
+        league_id (int): The ID of the league.
+        page (int): The page number of the standings. Defaults to 1.
+
+    Returns:
+        dict: The JSON response containing league standings data. Pages past the
+        end of the standings have no results; they are empty in the FPL API and
+        missing from recorded fixtures, so a 404 after the first page is
+        returned as an empty page.
+
+    Raises:
+        requests.RequestException: If the request failed or returned another error.
+        ValueError: If the response is not JSON.
+    """
+    response = api.get(league_standings_url(league_id, page))
+    if response.status_code == 404 and page > 1:
+        return {}
+    response.raise_for_status()
+    return response.json()
+
+def fetch_team_picks(team_id, gameweek):
+    """
+    Fetches team picks for a given team ID and gameweek.
+
+    Args:
+        team_id (int): The ID of the team.
+        gameweek (int): The gameweek number.
+
+    Returns:
+        dict: The JSON response containing team picks data. For teams without
+        picks that gameweek (e.g. created after it), the FPL API answers 404
+        with a JSON body that has no 'picks'.
+
+    Raises:
+        requests.RequestException: If the request failed or returned another error.
+        ValueError: If the response is not JSON.
+    """
+    url = f"https://fantasy.premierleague.com/api/entry/{team_id}/event/{gameweek}/picks/"
+    response = api.get(url)
+    if response.status_code != 404:
+        response.raise_for_status()
+    return response.json()
+
+def extract_manager_data(standings_data):
+    """
+    Extracts manager data from league standings data.
+    If standings are empty, it tries to extract from new_entries.
+
+    Args:
+        standings_data (dict): The JSON response containing league standings data.
+
+    Returns:
+        list: A list of dictionaries, each containing manager information.
+        Managers taken from the standings also carry their gameweek points
+        ('event_total'), total points ('total') and league rank ('rank', 'last_rank').
+    """
+    managers = []
+    if standings_data.get('standings', {}).get('results'):
+        for result in standings_data['standings']['results']:
+            managers.append({
+                'name': result['player_name'],
+                'team_name': result['entry_name'],
+                'team_id': result['entry'],
+                'event_total': result.get('event_total'),
+                'total': result.get('total'),
+                'rank': result.get('rank'),
+                'last_rank': result.get('last_rank'),
+            })
+    elif standings_data.get('new_entries', {}).get('results'):
+        print("No standings found, using new entries to populate managers.")
+        for result in standings_data['new_entries']['results']:
+            managers.append({
+                'name': f"{result['player_first_name']} {result['player_last_name']}",
+                'team_name': result['entry_name'],
+                'team_id': result['entry'],
+            })
+    return managers
+
+def standings_fingerprint(manager):
+    """
+    Returns the part of a manager's standings entry that changes when their picks response does.
+
+    The league rank is left out: it moves whenever other managers score, while
+    the manager's own picks response only changes with their own points.
+
+    Returns:
+        str: The fingerprint, or None if the manager did not come from the standings.
+    """
+    if manager.get('event_total') is None or manager.get('total') is None:
+        return None
+    return f"{manager['event_total']}:{manager['total']}"
+
+def compare_standings(old_managers, new_managers):
+    """
+    Compares two standings snapshots of the same league.
+
+    Args:
+        old_managers (list): The cached manager dictionaries.
+        new_managers (list): The freshly fetched manager dictionaries.
+
+    Returns:
+        dict: Lists of team IDs that 'joined', 'left', 'changed' (points changed)
+        or 'moved' (league rank changed only).
+    """
+    old_by_id = {manager['team_id']: manager for manager in old_managers}
+    new_ids = {manager['team_id'] for manager in new_managers}
+    changes = {'joined': [], 'left': [], 'changed': [], 'moved': []}
+    for manager in new_managers:
+        old = old_by_id.get(manager['team_id'])
+        if old is None:
+            changes['joined'].append(manager['team_id'])
+        elif standings_fingerprint(old) != standings_fingerprint(manager):
+            changes['changed'].append(manager['team_id'])
+        elif old.get('rank') != manager.get('rank'):
+            changes['moved'].append(manager['team_id'])
+    changes['left'] = [team_id for team_id in old_by_id if team_id not in new_ids]
+    return changes
+
+def managers_filename(league_id):
+    """Returns the filename of a league's cached managers."""
+    return f'{managers_directory}/{league_id}.json'
+
+def fetch_all_managers(league_id, cache_file=None, refresh=False):
+    """Fetches all managers from a league and caches them.
+
+    Args:
+        league_id: The ID of the league.
+        cache_file: The filename for the cached manager data, managers_filename(league_id) by default.
+        refresh: If True, refetch the standings even if the league is cached, so
+            new members and the managers' latest points are picked up.
+    """
+    if cache_file is None:
+        cache_file = managers_filename(league_id)
+
+    cached_managers = None
+    if os.path.exists(cache_file):
+        # Load cached data
+        with open(cache_file, 'r') as f:
+            cached_managers = json.load(f)
+        if not refresh:
+            return cached_managers
+
+    # Fetch from API and cache. The number of pages is unknown up front, so pages
+    # are requested in concurrent batches until one of them comes back empty.
+    all_managers = []
+    page = 1
+    finished = False
+    while not finished:
+        pages = list(range(page, page + api.MAX_CONCURRENT_REQUESTS))
+        print(f"Fetching pages {pages[0]}-{pages[-1]} of league standings...")
+        pages_data = api.map_concurrently(lambda p: fetch_league_standings(league_id, p), pages)
+        for data in pages_data:
+            managers = extract_manager_data(data)
+
+            # If the current page returned no managers, we assume we're done.
+            if not managers:
+                finished = True
+                break
+
+            all_managers.extend(managers)
+        page += len(pages)
+
+    if cached_managers is not None:
+        changes = compare_standings(cached_managers, all_managers)
+        print(f"League {league_id} standings: {len(changes['joined'])} joined, {len(changes['left'])} left, "
+              f"{len(changes['changed'])} with new points, {len(changes['moved'])} moved rank only")
+
+    # Store in cache. Each league has its own file, replaced atomically, so leagues
+    # fetched concurrently by the service and the daemon never rewrite each other's
+    # managers, and the service can delete a league's file when it evicts the league.
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    output.write_atomic(cache_file, json.dumps(all_managers).encode('utf-8'), compress=False)
+
+    return all_managers
+
+def fetch_all_team_picks(managers, league_id, gameweek, current_gameweek, current_gameweek_finished, cache_file=f'{CACHE_DIRECTORY}/picks.sqlite3'):
+    """Fetches team picks for all managers for a given league and gameweek and caches them.
+
+    Picks are cached per (team_id, gameweek), so teams shared between leagues are
+    only fetched once and an interrupted fetch resumes with the teams still missing.
+    For the current gameweek, only managers whose standings points changed since
+    their picks were cached are refetched.
+
+    Args:
+        managers: A list of manager dictionaries.
+        league_id: The ID of the league.
+        gameweek: The gameweek number to fetch data for.
+        current_gameweek: The current gameweek number.
+        current_gameweek_finished: Boolean indicating if the current gameweek has finished.
+        cache_file: The filename of the SQLite picks cache.
+
+    Returns:
+        records.PicksBatch: The picks of each manager, one row per manager in
+        the same order as `managers`; managers without picks that gameweek have
+        invalid rows. Each response is parsed as soon as it is read or fetched,
+        and the raw JSON is not kept.
+    """
+    cache = picks_cache.open_cache(cache_file)
+    team_ids = [manager['team_id'] for manager in managers]
+    fingerprints = {manager['team_id']: standings_fingerprint(manager) for manager in managers}
+
+    # Reading and parsing the cached responses, parsing the fetched ones and
+    # building the columns are timed as the 'process_picks' stage, within 'fetch'
+    # For previous gameweeks, always use cached data if available
+    if gameweek < current_gameweek:
+        with metrics.stage('process_picks'):
+            cached_picks = cache.get_many(team_ids, gameweek, parse=records.TeamPicks.from_payload)
+    else:
+        print(f"gameweek: {gameweek}, current_gameweek: {current_gameweek}, current_gameweek_finished: {current_gameweek_finished}")
+        # For the current gameweek, a cached response is kept while the manager's
+        # standings entry is unchanged since it was fetched, and marked final once
+        # the gameweek has finished. Without standings data to compare, cached
+        # picks are refetched once after the gameweek has finished.
+        cached_picks = {}
+        now_final = []
+        with metrics.stage('process_picks'):
+            entries = cache.get_entries(team_ids, gameweek, parse=records.TeamPicks.from_payload)
+        for team_id, entry in entries.items():
+            fingerprint = fingerprints[team_id]
+            if fingerprint is not None and entry.fingerprint is not None:
+                if fingerprint != entry.fingerprint:
+                    continue
+                if current_gameweek_finished and not entry.fetched_after_finished:
+                    now_final.append(team_id)
+            elif current_gameweek_finished and not entry.fetched_after_finished:
+                continue
+            cached_picks[team_id] = entry.payload
+        if now_final:
+            cache.mark_finished(now_final, gameweek)
+
+    missing = [manager for manager in managers if manager['team_id'] not in cached_picks]
+    metrics.increment('picks_cache_hits', len(cached_picks))
+    metrics.increment('picks_cache_misses', len(missing))
+    print(f"League {league_id} gameweek {gameweek}: {len(cached_picks)} teams cached, {len(missing)} to fetch")
+
+    # Fetch from API concurrently; api.get keeps the request rate polite. Each
+    # response is written to the cache as soon as it arrives. A manager whose
+    # request keeps failing is left out of this run and fetched again next time,
+    # rather than failing the whole gameweek or caching the error.
+    def fetch_manager_picks(manager):
+        print(f"Fetching picks for {manager['name']}...")
+        try:
+            return fetch_team_picks(manager['team_id'], gameweek)
+        except (requests.RequestException, ValueError) as e:
+            print(f"Warning: fetching picks for manager {manager['team_id']} gameweek {gameweek} failed: {e}. Skipping this manager.")
+            metrics.increment('picks_fetch_failures')
+            return None
+
+    fetched_after_finished = gameweek < current_gameweek or current_gameweek_finished
+    try:
+        for manager, picks in api.imap_unordered(fetch_manager_picks, missing):
+            if picks is None:
+                cached_picks[manager['team_id']] = None
+                continue
+            if 'picks' not in picks:
+                print(f"Warning: 'picks' key missing for manager {manager['team_id']} gameweek {gameweek}. Skipping this manager.")
+            cache.put(manager['team_id'], gameweek, picks, fetched_after_finished, fingerprints[manager['team_id']])
+            with metrics.stage('process_picks'):
+                cached_picks[manager['team_id']] = records.TeamPicks.from_payload(picks)
+    finally:
+        cache.flush()
+
+    with metrics.stage('process_picks'):
+        return records.PicksBatch.from_records([cached_picks[team_id] for team_id in team_ids])
+
+
+def process_picks(picks):
+    """
+    Processes team picks data to extract relevant information, subtracting transfer cost for true GW points.
+
+    The pipeline parses whole gameweeks into columns with records.PicksBatch;
+    this returns the same fields for a single response.
+
+    Args:
+        picks (dict): The JSON response containing team picks data.
+
+    Returns:
+        tuple: A tuple containing:
+            - list: Player IDs in the team.
+            - int: Captain player ID.
+            - int: Vice-captain player ID.
+            - int: Total points for the team.
+            - int: Rank of the team.
+            - int: GW points (true points, with event_transfers_cost subtracted).
+            - int: GW rank.
+            - str: Active chip.
+    """
+    team_picks = records.TeamPicks.from_payload(picks)
+    if team_picks is None:
+        print(picks)
+        print(f"Warning: 'picks' key missing for this manager. Returning None values.")
+        return None, None, None, None, None, None, None, None  # Return None for missing data
+    return team_picks.as_tuple()
+
+def fetch_league_names(league_ids, cache_file=f'{DATA_DIRECTORY}/leagues.json'):
+  """
+  Fetches the names of the leagues specified in league_ids and saves them to a JSON file.
+
+  Args:
+      league_ids (list): A list of league IDs.
+      cache_file (str): The filename for the cached league data. Defaults to 'leagues.json'.
+  """
+
+  cache_key = 'leagues'
+  cached_data = {}
+
+  if os.path.exists(cache_file):
+      # Load cached data
+      with open(cache_file, 'r') as f:
+          cached_data = json.load(f)
+
+  # Fetch from API and cache
+  def fetch_league_first_page(league_id):
+      print(f"Fetching league name for league ID {league_id}...")
+      return fetch_league_standings(league_id)
+
+  leagues = []
+  for league_id, standings_data in zip(league_ids, api.map_concurrently(fetch_league_first_page, league_ids)):
+      league_name = standings_data['league']['name']
+      leagues.append({'id': league_id, 'name': league_name})
+
+  # Store in cache
+  cached_data[cache_key] = leagues
+  output.write_atomic(cache_file, json.dumps(cached_data).encode('utf-8'))
+
+  # Update available_leagues.json
+  available_leagues_file = f'{DATA_DIRECTORY}/available_leagues.json'
+  output.write_atomic(available_leagues_file, json.dumps(leagues, indent=2).encode('utf-8'))
+  print(f"League names saved to {available_leagues_file}")
+
+
+def results_filename(league_id, gameweek):
+    """Returns the path of the similarity results file for a league and gameweek."""
+    return f'{DATA_DIRECTORY}/fpl_team_similarity_{league_id}_gw{gameweek}.json'
+
+def process_gameweek(league_id, gameweek, managers, all_picks, player_price_lookup, backend=embedding_backend, incremental=incremental_embedding, n_jobs=embedding.N_JOBS,
+                     record_history=True):
+    """
+    Groups, vectorizes and embeds the teams of one league in one gameweek and saves the results.
+
+    This is the CPU-bound part of the pipeline; it makes no API calls, so the
+    batch runner can run it in a worker process.
+
+    Args:
+        league_id (int): The ID of the league.
+        gameweek (int): The gameweek number.
+        managers (list): The league's manager dictionaries.
+        all_picks (records.PicksBatch): The managers' picks, one row per manager
+            of `managers`.
+        player_price_lookup (numpy.ndarray): The gameweek's player prices indexed by player ID.
+        backend (str): The embedding backend to use.
+        incremental (bool): Whether to warm-start from the previous gameweek's layout.
+        n_jobs (int): Number of threads the embedding may use.
+        record_history (bool): Append the gameweek to the league's season history
+            in history_directory.
+
+    Returns:
+        str: The results filename, or None if there was no valid team data.
+    """
+    print(f"Processing league {league_id} gameweek {gameweek}")
+
+    # --- Main Processing Block ---
+
+    # 1, 4-5. Add the managers' picks to the groups of identical teams, by team
+    # signature, aggregating the data for each group in the same pass
+    with metrics.stage('group'):
+        groups = grouping.TeamGroups()
+        group_of = groups.add_batch(managers, all_picks)
+    metrics.increment('teams_processed', groups.n_teams)
+    metrics.increment('unique_teams', len(groups))
+
+    if not len(groups):
+        print(f"No valid team data to process for Gameweek {gameweek}. Skipping.")
+        return None
+
+    # 2-3. Build the weighted vector of every unique team as one sparse matrix,
+    # with one column per player owned by at least one team
+    with metrics.stage('vectorize'):
+        unique_vectors, all_player_ids = groups.team_matrix(player_price_lookup)
+    aggregated_data = groups.records
+
+    # 6. Run dimensionality reduction on the unique vectors
+    with metrics.stage('pca'):
+        from sklearn.decomposition import PCA
+
+
+        # Using PCA to reduce dimensions. The ARPACK solver works on the sparse matrix
+        # directly but needs more than two samples and features.
+        if min(unique_vectors.shape) > 2:
+            pca = PCA(n_components=2, svd_solver='arpack')
+            pca_result = pca.fit_transform(unique_vectors)
+        else:
+            pca = PCA(n_components=2)
+            pca_result = pca.fit_transform(unique_vectors.toarray())
+
+    # Using t-SNE (or the configured embedding backend) to reduce dimensions.
+    # When the previous gameweek has results, start from its layout and only
+    # refine it; otherwise start from the PCA layout.
+    with metrics.stage('tsne'):
+        warm_start = None
+        if incremental:
+            previous_layout = embedding.load_previous_layout(results_filename(league_id, gameweek - 1))
+            if previous_layout:
+                warm_start = embedding.warm_start_layout(aggregated_data, unique_vectors, previous_layout)
+        tsne_result = embedding.embed(unique_vectors, pca_result, backend=backend, n_jobs=n_jobs, init=warm_start, refine=warm_start is not None)
+    metrics.increment('warm_starts' if warm_start is not None else 'cold_starts')
+
+    # 7. Combine aggregated data with coordinates and save it
+    for i, record in enumerate(aggregated_data):
+        record['pca_x'] = float(pca_result[i, 0])
+        record['pca_y'] = float(pca_result[i, 1])
+        record['tsne_x'] = float(tsne_result[i, 0])
+        record['tsne_y'] = float(tsne_result[i, 1])
+
+    # Construct the filename using league ID and gameweek
+    filename = results_filename(league_id, gameweek)
+
+    # Save the records JSON and the compact columnar JSON, each with a gzipped copy
+    with metrics.stage('write'):
+        written = output.write_results(aggregated_data, filename)
+    print(f"Data saved to '{filename}' ({written} bytes written)")
+
+    # 8. Save the ownership and nearest-neighbour index alongside the results
+    with metrics.stage('index'):
+        index = similarity_index.build_index(groups, unique_vectors)
+        index_file = similarity_index.index_filename(filename)
+        written = similarity_index.write_index(index, index_file)
+    print(f"Index saved to '{index_file}' ({written} bytes written)")
+
+    # 9. Append the gameweek's squads and coordinates to the league's season history
+    if record_history and history_directory is not None:
+        with metrics.stage('history'):
+            history.append_gameweek(history_directory, league_id, gameweek, managers, all_picks, group_of, tsne_result)
+
+
+
+
+    # Construct the filename using league ID and gameweek
+    #   filename = f'{DATA_DIRECTORY}/fpl_team_similarity_{league_id}_gw{gameweek}.csv'
+
+    # Save to CSV
+    #   results_df.to_csv(filename, index=False)
+    #   print(f"Data saved to '{filename}'")
+
+
+
+
+    if (make_plots):
+        import matplotlib.pyplot as plt
+        import pandas as pd
+
+        results_df = pd.DataFrame(aggregated_data)
+
+        # Plotting with improved label placement
+        plt.figure(figsize=(20, 10))
+
+        def plot_with_labels(ax, x, y, labels, highlight_ids, managers_with_player_328):
+            """
+            Plots a scatter plot with labels and highlights specific managers.
+
+            Args:
+                ax: The matplotlib axes object.
+                x: The x-coordinates of the points.
+                y: The y-coordinates of the points.
+                labels: The labels for each point.
+                highlight_ids: A set of group indexes to highlight in green.
+                managers_with_player_328: A set of group indexes to highlight in red.
+            """
+            ax.scatter(x, y)
+            texts = []
+            for i, label in enumerate(labels):
+                if i in highlight_ids:
+                    if i in managers_with_player_328:
+                        ax.scatter(x[i], y[i], c='yellow', s=100, marker='o')
+                    else: 
+                        ax.scatter(x[i], y[i], c='green', s=100, marker='o')
+                else: 
+                    if i in managers_with_player_328:
+                        ax.scatter(x[i], y[i], c='red', s=100, marker='o') 
+                texts.append(ax.text(x[i], y[i], label, fontsize=8, ha='center', va='bottom'))  # Add text labels
+
+        def groups_owning(player_id):
+            """Returns the indexes of the plotted groups whose teams own a player."""
+            owners = index['ownership'].get(player_id, {'team_ids': []})['team_ids']
+            return {index['team_groups'][team_id] for team_id in owners}
+
+        # Find the groups of managers who own player 351 and player 328
+        managers_with_player_haaland = groups_owning(351)
+        managers_with_player_salah = groups_owning(328)
+
+        plt.subplot(1, 2, 1)
+        plot_with_labels(plt.gca(), results_df['pca_x'], results_df['pca_y'], results_df['manager_names'].str[0], managers_with_player_haaland, managers_with_player_salah)
+        plt.title('PCA Result')
+
+        plt.subplot(1, 2, 2)
+        plot_with_labels(plt.gca(), results_df['tsne_x'], results_df['tsne_y'], results_df['manager_names'].str[0], managers_with_player_haaland, managers_with_player_salah)
+        plt.title('t-SNE Result')
+
+        plt.tight_layout()
+
+        figure_filename = f'./graphs/fpl_team_similarity_{league_id}_gw{gameweek}.png'
+        plt.savefig(figure_filename, dpi=300, bbox_inches='tight')
+        print(f'Graph saved as ${figure_filename}')
+
+    return filename
+
+def _process_gameweek_job(profile_file, league_id, gameweek, *args):
+    """
+    Runs process_gameweek in a batch worker process and returns the worker's metrics.
+
+    Worker processes are reused, so the metrics are reset before each job. With
+    `profile_file` set, the job is profiled to `{profile_file}_{league}_gw{N}.prof`.
+    """
+    metrics.reset()
+    if profile_file is not None:
+        profile_file = f'{os.path.splitext(profile_file)[0]}_{league_id}_gw{gameweek}.prof'
+    with metrics.profiled(profile_file):
+        process_gameweek(league_id, gameweek, *args)
+    return metrics.snapshot()
+
+def worker_pool(jobs):
+    """
+    Creates the pool of worker processes for the CPU-bound steps.
+
+    Workers are started by a fork server rather than forked from this process,
+    whose fetch threads may hold locks (the rate limiter's, the picks cache's)
+    that would stay locked forever in a forked child.
+    """
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('forkserver'))
+
+def parse_gameweeks(spec, current_gameweek):
+    """
+    Parses a gameweek selection such as 'current', '5', '1-38' or '1,3,5-7'.
+
+    Args:
+        spec (str): The gameweek selection.
+        current_gameweek (int): The current gameweek number, used for 'current'.
+
+    Returns:
+        list: The selected gameweek numbers in ascending order.
+
+    Raises:
+        ValueError: If the selection cannot be parsed or includes a future gameweek.
+    """
+    gameweeks = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if part == 'current':
+            gameweeks.add(current_gameweek)
+        elif '-' in part:
+            start, end = part.split('-', 1)
+            gameweeks.update(range(int(start), int(end) + 1))
+        else:
+            gameweeks.add(int(part))
+    if not gameweeks or min(gameweeks) < 1 or max(gameweeks) > current_gameweek:
+        raise ValueError(f"Gameweeks must be between 1 and the current gameweek ({current_gameweek}), got '{spec}'")
+    return sorted(gameweeks)
+
+def run_batch(league_ids, gameweek_spec='current', jobs=1, force=False, backend=embedding_backend, incremental=incremental_embedding, profile_file=None,
+              season=None, refresh_standings=True, executor=None, record_history=True):
+    """
+    Computes the similarity results for every combination of leagues and gameweeks.
+
+    The work forms a small DAG. Managers are fetched once per league and picks
+    once per (league, gameweek); the leagues of a gameweek are fetched one after
+    another, so teams they share come from the picks cache, and a failure only
+    fails its own league. Each (league, gameweek) is
+    then processed in a pool of `jobs` worker processes as soon as its picks are
+    in and, with incremental embeddings, the league's previous gameweek is done.
+    Fetch jobs run on threads and share the rate limit in fpl_similarity.api.
+
+    Results of past gameweeks that already exist are not recomputed unless
+    `force` is set, so an interrupted backfill resumes where it stopped.
+
+    Args:
+        league_ids (list): The league IDs to process.
+        gameweek_spec (str): The gameweeks to process, see parse_gameweeks.
+        jobs (int): Number of worker processes for the CPU-bound steps.
+        force (bool): Recompute results that already exist.
+        backend (str): The embedding backend to use.
+        incremental (bool): Whether to warm-start from the previous gameweek's layout.
+        profile_file (str): If set, each (league, gameweek) job is profiled with
+            cProfile to a file named after this one.
+        season (tuple): The result of fetch_player_data, if the caller already has it.
+        refresh_standings (bool): Refetch the standings of leagues whose current
+            gameweek is processed. The daemon passes False after refreshing them itself.
+        executor (concurrent.futures.Executor): A process pool to run the jobs in.
+            By default a pool of `jobs` workers is started for this batch only.
+        record_history (bool): Append each gameweek to its league's season history.
+            The service passes False, as it does not keep the leagues it computes.
+
+    Returns:
+        list: The (league_id, gameweek) pairs that failed.
+    """
+    if season is None:
+        with metrics.stage('fetch'):
+            season = fetch_player_data()
+    player_data, current_gameweek, current_gameweek_finished = season
+    print(f"Current gameweek: {current_gameweek}, finished: {current_gameweek_finished}")
+
+    # Each gameweek is weighted with its own prices; gameweeks from before the
+    # price history was started use the closest snapshot
+    price_history = players.PriceHistory(price_history_file)
+    current_prices = vectorize.price_lookup({int(player_id): info['now_cost'] for player_id, info in player_data.items()})
+
+    def gameweek_prices(gameweek):
+        prices = price_history.lookup(gameweek)
+        return current_prices if prices is None else prices
+
+    gameweeks = parse_gameweeks(gameweek_spec, current_gameweek)
+    pending = []
+    for league_id in league_ids:
+        for gameweek in gameweeks:
+            if not force and gameweek < current_gameweek and os.path.exists(results_filename(league_id, gameweek)):
+                print(f"Results for league {league_id} gameweek {gameweek} already exist, skipping")
+            else:
+                pending.append((league_id, gameweek))
+    if not pending:
+        return []
+
+    # Split the cores between the worker processes
+    n_jobs = max(1, (os.cpu_count() or 1) // jobs)
+    failed = []
+
+    cpu_pool_context = worker_pool(jobs) if executor is None else contextlib.nullcontext(executor)
+    with ThreadPoolExecutor(max_workers=2) as io_pool, cpu_pool_context as cpu_pool:
+        # Managers jobs are submitted first, so picks jobs waiting on them cannot starve them
+        # The standings are refetched when the current gameweek is processed, so
+        # new members and changed points are picked up
+        def fetch_league_managers(league_id):
+            with metrics.stage('fetch'):
+                return fetch_all_managers(league_id, refresh=refresh_standings and (league_id, current_gameweek) in pending)
+
+        managers_futures = {
+            league_id: io_pool.submit(fetch_league_managers, league_id)
+            for league_id in dict.fromkeys(league_id for league_id, _ in pending)
+        }
+
+        def fetch_league_picks(league_id, gameweek, previous):
+            managers = managers_futures[league_id].result()
+            if previous is not None:
+                wait([previous])  # Submitted earlier, so already running or done
+            with metrics.stage('fetch'):
+                return fetch_all_team_picks(managers, league_id, gameweek, current_gameweek, current_gameweek_finished)
+
+        picks_futures = {}
+        last_of_gameweek = {}
+        for league_id, gameweek in sorted(pending, key=lambda job: job[1]):
+            picks_futures[league_id, gameweek] = last_of_gameweek[gameweek] = io_pool.submit(
+                fetch_league_picks, league_id, gameweek, last_of_gameweek.get(gameweek))
+
+        waiting = list(pending)
+        running = {}
+        while waiting or running:
+            for league_id, gameweek in list(waiting):
+                picks_future = picks_futures[league_id, gameweek]
+                if not picks_future.done():
+                    continue
+                # The warm start reads the previous gameweek's results, so wait for them
+                previous = (league_id, gameweek - 1)
+                if incremental and (previous in waiting or previous in running.values()):
+                    continue
+                waiting.remove((league_id, gameweek))
+                try:
+                    managers = managers_futures[league_id].result()
+                    all_picks = picks_future.result()
+                except Exception as e:
+                    print(f"Error: fetching league {league_id} gameweek {gameweek} failed: {e}")
+                    failed.append((league_id, gameweek))
+                    continue
+                future = cpu_pool.submit(_process_gameweek_job, profile_file, league_id, gameweek, managers, all_picks, gameweek_prices(gameweek), backend, incremental, n_jobs, record_history)
+                running[future] = (league_id, gameweek)
+
+            outstanding = list(running) + [future for future in picks_futures.values() if not future.done()]
+            if not outstanding:
+                continue
+            done, _ = wait(outstanding, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in running:
+                    league_id, gameweek = running.pop(future)
+                    try:
+                        metrics.merge(future.result())
+                    except Exception as e:
+                        print(f"Error: processing league {league_id} gameweek {gameweek} failed: {e}")
+                        failed.append((league_id, gameweek))
+
+    return failed
+
+def main(argv=None):
+    """Command line entry point; see --help."""
+    parser = argparse.ArgumentParser(description="Compute FPL league similarity results for leagues and gameweeks.")
+    parser.add_argument('--leagues', type=int, nargs='+', default=league_ids, help="League IDs to process (default: %(default)s)")
+    parser.add_argument('--gameweeks', default='current', help="Gameweeks to process, e.g. 'current', '7', '1-38' or '1,3,5-7' (default: %(default)s)")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="Worker processes for vectorizing and embedding (default: %(default)s)")
+    parser.add_argument('--force', action='store_true', help="Recompute results that already exist")
+    parser.add_argument('--backend', choices=embedding.EMBEDDING_BACKENDS, default=embedding_backend, help="Embedding backend (default: %(default)s)")
+    parser.add_argument('--no-incremental', dest='incremental', action='store_false', default=incremental_embedding, help="Do not warm-start from the previous gameweek's layout")
+    parser.add_argument('--requests-per-second', type=float, help="FPL API request rate limit (default: %s)" % api.REQUESTS_PER_SECOND)
+    parser.add_argument('--report', default=run_report_file, help="Run report path; a Prometheus .prom file and a .history.jsonl log are written next to it (default: %(default)s)")
+    parser.add_argument('--profile', metavar='FILE', help="Profile the run with cProfile and save the stats to FILE (each league/gameweek job goes to its own file next to it)")
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.requests_per_second:
+        api.configure(requests_per_second=args.requests_per_second)
+
+    started_at = time.time()
+    with metrics.profiled(args.profile):
+        with metrics.stage('fetch'):
+            fetch_league_names(args.leagues)
+        failed = run_batch(args.leagues, args.gameweeks, jobs=args.jobs, force=args.force, backend=args.backend, incremental=args.incremental, profile_file=args.profile)
+    report = metrics.write_report(args.report, started_at, failed, extra={
+        'leagues': args.leagues,
+        'gameweeks': args.gameweeks,
+        'jobs': args.jobs,
+        'backend': args.backend,
+        'incremental': args.incremental,
+    })
+    print(f"Run report saved to '{args.report}' ({report['wall_seconds']:.1f}s, peak RSS {report['peak_rss_bytes'] / 2**20:.0f} MiB)")
+    if failed:
+        print(f"{len(failed)} league/gameweek jobs failed: {failed}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Player metadata: names, prices and the current gameweek, with a per-gameweek price history.
+
+The bootstrap-static payload is several megabytes, of which the pipeline keeps
+each player's web name and cost. `refresh` requests it conditionally and only
+parses it when it changed; otherwise the trimmed player_data.json written by
+the previous refresh is reused. The validators are shared by every data
+directory (they live in api.HTTP_CACHE_DIRECTORY), so player_data.json records
+the validator of the payload it was parsed from, and is only reused when that
+is the payload the server confirmed.
+
+Prices change during the season, and a gameweek's teams were picked at that
+gameweek's prices. `PriceHistory` keeps one snapshot of every player's price per
+gameweek, taken the first time the gameweek is seen as current (the closest
+to its deadline this process gets), as arrays indexed by player ID
+(see vectorize.price_lookup). Gameweeks from before the history was started
+fall back to the closest snapshot, so a season backfill needs one bootstrap
+request, not one per gameweek.
+"""
+import io
+import json
+import os
+
+import numpy as np
+
+from fpl_similarity import api, output, vectorize
+
+BOOTSTRAP_URL = "https://fantasy.premierleague.com/api/bootstrap-static/"
+
+
+def _parse_bootstrap(data):
+    """Extracts the trimmed player metadata from a bootstrap-static payload."""
+    current_gameweek = next(event['id'] for event in data['events'] if event['is_current'])
+    return {
+        'player_data': {
+            element['id']: {
+                'web_name': element['web_name'],
+                'now_cost': element['now_cost'] / 10  # Dividing by 10 to get the correct cost
+            } for element in data['elements']
+        },
+        'current_gameweek': current_gameweek,
+        'current_gameweek_finished': data['events'][current_gameweek - 1]['finished'],
+    }
+
+
+def refresh(json_file):
+    """
+    Fetches the player metadata, parsing bootstrap-static only if it changed.
+
+    Args:
+        json_file (str): The trimmed player data file, read by the web app. It
+            is rewritten atomically when the payload changed.
+
+    Returns:
+        tuple: (player data keyed by player ID, current gameweek, whether it
+        has finished, whether the payload changed since the last refresh).
+
+    Raises:
+        requests.RequestException: If there's an error fetching data from the API.
+    """
+    response = api.get(BOOTSTRAP_URL, conditional=True)
+    response.raise_for_status()  # Raise an exception for bad responses
+    validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+    metadata = None
+    if response.from_cache and validator and os.path.exists(json_file):
+        with open(json_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        if metadata.get('validator') != validator:
+            # Written from another payload, e.g. by a run on another data
+            # directory before this one's validators were refreshed
+            metadata = None
+    changed = metadata is None
+    if changed:
+        # On a 304 the response holds the stored body of the confirmed payload
+        metadata = {**_parse_bootstrap(response.json()), 'validator': validator}
+        output.write_atomic(json_file, json.dumps(metadata, separators=(',', ':')).encode('utf-8'))
+
+    player_data = {int(player_id): info for player_id, info in metadata['player_data'].items()}
+    return player_data, metadata['current_gameweek'], metadata['current_gameweek_finished'], changed
+
+
+class PriceHistory:
+    """
+    Player prices by gameweek, each stored as an array indexed by player ID.
+
+    Args:
+        filename (str): The .npz file holding the snapshots; created on the first `record`.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.snapshots = {}
+        if os.path.exists(filename):
+            with np.load(filename) as saved:
+                self.snapshots = {int(name[2:]): saved[name] for name in saved.files}
+
+    def record(self, gameweek, player_data):
+        """
+        Saves the prices as the gameweek's snapshot, unless it already has one.
+
+        Returns:
+            bool: Whether a snapshot was added.
+        """
+        if gameweek in self.snapshots:
+            return False
+        prices = {player_id: info['now_cost'] for player_id, info in player_data.items()}
+        self.snapshots[gameweek] = vectorize.price_lookup(prices)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **{f'gw{gw}': snapshot for gw, snapshot in self.snapshots.items()})
+        output.write_atomic(self.filename, buffer.getvalue(), compress=False)
+        return True
+
+    def lookup(self, gameweek):
+        """
+        Returns the prices for a gameweek, indexed by player ID.
+
+        Gameweeks without a snapshot get the closest one, the earlier on ties.
+
+        Returns:
+            np.ndarray: The prices, or None if there are no snapshots at all.
+        """
+        if not self.snapshots:
+            return None
+        closest = min(self.snapshots, key=lambda gw: (abs(gw - gameweek), gw))
+        return self.snapshots[closest]
@@ -0,0 +1,214 @@
+"""
+Compact parsed form of a team's picks response.
+
+A raw picks response is a JSON document of a few kilobytes; the pipeline only
+needs the squad and a handful of numbers from it. `TeamPicks.from_payload`
+extracts those once, as soon as a response is fetched or read from the cache,
+so the raw JSON can be dropped straight away and only the compact records are
+kept. `PicksBatch` then stores a whole gameweek of them as NumPy columns,
+which is what is passed to worker processes and grouped.
+"""
+import numpy as np
+
+SQUAD_SIZE = 15
+
+# Stored in the rank columns for ranks the API returns as null
+MISSING_RANK = -1
+
+
+class TeamPicks:
+    """
+    The fields of one picks response used by the pipeline.
+
+    The squad is stored as two tuples, the player IDs and their squad
+    positions (1-11 starting, 12-15 bench), in pick order.
+    """
+
+    __slots__ = ('elements', 'positions', 'captain', 'vice_captain', 'total_points', 'rank',
+                 'gw_points', 'gw_rank', 'active_chip')
+
+    def __init__(self, elements, positions, captain, vice_captain, total_points, rank, gw_points, gw_rank, active_chip):
+        self.elements = elements
+        self.positions = positions
+        self.captain = captain
+        self.vice_captain = vice_captain
+        self.total_points = total_points
+        self.rank = rank
+        self.gw_points = gw_points
+        self.gw_rank = gw_rank
+        self.active_chip = active_chip
+
+    @classmethod
+    def from_payload(cls, picks):
+        """
+        Parses a picks response, subtracting the transfer cost from the gameweek points.
+
+        Args:
+            picks (dict): The JSON response containing team picks data.
+
+        Returns:
+            TeamPicks: The parsed picks, or None if the response has no 'picks'
+            (e.g. the manager joined after that gameweek).
+        """
+        if 'picks' not in picks:
+            return None
+        captain = vice_captain = None
+        for pick in picks['picks']:
+            if pick['is_captain'] and captain is None:
+                captain = pick['element']
+            if pick['is_vice_captain'] and vice_captain is None:
+                vice_captain = pick['element']
+        history = picks['entry_history']
+        return cls(
+            tuple(pick['element'] for pick in picks['picks']),
+            tuple(pick['position'] for pick in picks['picks']),
+            captain,
+            vice_captain,
+            history['total_points'],
+            history['overall_rank'],
+            history['points'] - history['event_transfers_cost'],  # True GW points
+            history['rank'],
+            picks.get('active_chip'),
+        )
+
+    @property
+    def team(self):
+        """The squad as a list of (player_id, position) tuples."""
+        return list(zip(self.elements, self.positions))
+
+    def as_tuple(self):
+        """Returns the fields in the order of the tuple returned by pipeline.process_picks."""
+        return (self.team, self.captain, self.vice_captain, self.total_points, self.rank,
+                self.gw_points, self.gw_rank, self.active_chip)
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class PicksBatch:
+    """
+    The picks of every manager of a league in one gameweek, as NumPy columns.
+
+    Row i holds manager i's picks; rows of managers without picks have
+    `valid` False. Squads are padded to SQUAD_SIZE with element 0 and
+    position 0. Chips are stored as codes into `chip_names`, where code 0 is
+    no chip.
+
+    Attributes:
+        valid (np.ndarray): N booleans, whether the manager has picks.
+        elements (np.ndarray): N x SQUAD_SIZE int32 player IDs, in pick order.
+        positions (np.ndarray): N x SQUAD_SIZE int8 squad positions (1-15).
+        captain (np.ndarray): N x SQUAD_SIZE booleans marking the captain's pick.
+        vice_captain (np.ndarray): N x SQUAD_SIZE booleans marking the vice-captain's pick.
+        chip_codes (np.ndarray): N int8 codes into `chip_names`.
+        chip_names (list): The chip of each code, None first.
+        total_points, rank, gw_points, gw_rank (np.ndarray): N int64 columns;
+            ranks the API returned as null are MISSING_RANK.
+    """
+
+    def __init__(self, n):
+        self.valid = np.zeros(n, dtype=bool)
+        self.elements = np.zeros((n, SQUAD_SIZE), dtype=np.int32)
+        self.positions = np.zeros((n, SQUAD_SIZE), dtype=np.int8)
+        self.captain = np.zeros((n, SQUAD_SIZE), dtype=bool)
+        self.vice_captain = np.zeros((n, SQUAD_SIZE), dtype=bool)
+        self.chip_codes = np.zeros(n, dtype=np.int8)
+        self.chip_names = [None]
+        self.total_points = np.zeros(n, dtype=np.int64)
+        self.rank = np.full(n, MISSING_RANK, dtype=np.int64)
+        self.gw_points = np.zeros(n, dtype=np.int64)
+        self.gw_rank = np.full(n, MISSING_RANK, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.valid)
+
+    @classmethod
+    def from_records(cls, team_picks):
+        """
+        Stores parsed picks in columns, in one pass.
+
+        Args:
+            team_picks (list): A TeamPicks, or None for managers without picks, per manager.
+        """
+        batch = cls(len(team_picks))
+        rows = np.array([i for i, picks in enumerate(team_picks) if picks is not None], dtype=np.intp)
+        picked = [team_picks[i] for i in rows]
+        if not picked:
+            return batch
+        batch.valid[rows] = True
+
+        sizes = [len(picks.elements) for picks in picked]
+        if max(sizes) > SQUAD_SIZE:
+            raise ValueError(f"A squad has {max(sizes)} picks, more than {SQUAD_SIZE}")
+        if min(sizes) == SQUAD_SIZE:
+            batch.elements[rows] = [picks.elements for picks in picked]
+            batch.positions[rows] = [picks.positions for picks in picked]
+        else:
+            for i, picks, n in zip(rows, picked, sizes):
+                batch.elements[i, :n] = picks.elements
+                batch.positions[i, :n] = picks.positions
+
+        def pick_mask(player_ids):
+            player_ids = np.array([0 if player_id is None else player_id for player_id in player_ids], dtype=np.int32)
+            return (batch.elements[rows] == player_ids[:, None]) & (batch.positions[rows] > 0)
+
+        batch.captain[rows] = pick_mask([picks.captain for picks in picked])
+        batch.vice_captain[rows] = pick_mask([picks.vice_captain for picks in picked])
+
+        chip_codes = {None: 0}
+        for i, picks in zip(rows, picked):
+            code = chip_codes.get(picks.active_chip)
+            if code is None:
+                code = chip_codes[picks.active_chip] = len(batch.chip_names)
+                batch.chip_names.append(picks.active_chip)
+            batch.chip_codes[i] = code
+
+        def column(values):
+            return np.fromiter((MISSING_RANK if value is None else value for value in values), dtype=np.int64, count=len(picked))
+
+        batch.total_points[rows] = column(picks.total_points for picks in picked)
+        batch.rank[rows] = column(picks.rank for picks in picked)
+        batch.gw_points[rows] = column(picks.gw_points for picks in picked)
+        batch.gw_rank[rows] = column(picks.gw_rank for picks in picked)
+        return batch
+
+    @classmethod
+    def from_payloads(cls, payloads):
+        """Parses picks responses (see TeamPicks.from_payload) straight into columns."""
+        return cls.from_records([TeamPicks.from_payload(payload) for payload in payloads])
+
+    def captains(self):
+        """Returns each row's captain player ID, 0 for rows without one."""
+        return np.where(self.captain.any(axis=1), self.elements[np.arange(len(self)), self.captain.argmax(axis=1)], 0)
+
+    def vice_captains(self):
+        """Returns each row's vice-captain player ID, 0 for rows without one."""
+        return np.where(self.vice_captain.any(axis=1), self.elements[np.arange(len(self)), self.vice_captain.argmax(axis=1)], 0)
+
+    def team_picks(self, i):
+        """Returns row i as a TeamPicks, or None if the manager has no picks."""
+        if not self.valid[i]:
+            return None
+        picked = self.positions[i] > 0
+        captain = self.elements[i][self.captain[i]]
+        vice_captain = self.elements[i][self.vice_captain[i]]
+        return TeamPicks(
+            tuple(self.elements[i][picked].tolist()),
+            tuple(self.positions[i][picked].tolist()),
+            int(captain[0]) if len(captain) else None,
+            int(vice_captain[0]) if len(vice_captain) else None,
+            int(self.total_points[i]),
+            optional_rank(self.rank[i]),
+            int(self.gw_points[i]),
+            optional_rank(self.gw_rank[i]),
+            self.chip_names[self.chip_codes[i]],
+        )
+
+
+def optional_rank(rank):
+    """Converts a value of a rank column back to the API's form, None for MISSING_RANK."""
+    return None if rank == MISSING_RANK else int(rank)
@@ -0,0 +1,592 @@
+"""
+Serves the similarity results of any league on demand, computing them in the background.
+
+Only the leagues in pipeline.league_ids are computed by the batch and the
+daemon. This service accepts any league ID and gameweek: results already in
+the data directory are returned straight away, and missing ones are computed
+by a background pool, with concurrent requests for the same league and
+gameweek sharing one computation. The files written by the pipeline are the
+store, with the usual gzip copies. `ResultStore` accounts for the size of each
+league's files and evicts the least recently used results once the store is
+over budget, starting with leagues using more than their share. Computations
+here record no season history, and a league's cached managers are deleted with
+its last result, so nothing else in the cache grows with the leagues served. The daemon's
+leagues are never evicted, nor recomputed here: the daemon keeps them up to
+date. Results of the current gameweek are recomputed once they are older than
+a TTL, and are served stale while that runs, until the gameweek has finished.
+
+Endpoints:
+    GET /api/similarity/{league_id}/{gameweek}[?format=records|columns|index][&wait=seconds]
+        200 with the results file, or 202 if they are still being computed
+        after `wait` seconds (ask again after Retry-After). Leagues that do not
+        exist get 404, and leagues with more than --max-entries teams 422.
+    GET /api/status
+        The store's size, per-league costs, pending computations and counters.
+
+server.js forwards /api to the service when FPL_SIMILARITY_API is set.
+
+Usage:
+    FPL_DATA_DIRECTORY=/srv/fpl-data python -m fpl_similarity.service [--port 8082] [--workers 2] [--max-mib 2048]
+        [--max-entries 50000]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from fpl_similarity import api, embedding, metrics, output, pipeline, similarity_index
+
+# Size of the results store on disk, including the gzip copies
+MAX_STORE_BYTES = 2 * 2**30
+
+# Share of the store one league may use before its results are evicted first
+MAX_LEAGUE_SHARE = 0.125
+
+# Seconds before results of a gameweek that has not finished are recomputed
+CURRENT_GAMEWEEK_TTL = 900
+
+# Seconds the current gameweek and player prices are reused before refetching them
+SEASON_TTL = 300
+
+# Computations queued or running at once; further misses get 503
+MAX_PENDING = 32
+
+# Seconds a request waits for a computation before getting 202, by default and at most
+DEFAULT_WAIT = 20
+MAX_WAIT = 120
+
+# Seconds a failed computation is reported as failed before it is retried
+FAILURE_TTL = 60
+
+# Largest league computed on demand, in teams
+MAX_ENTRIES = 50000
+
+# Teams per page of the FPL league standings
+STANDINGS_PAGE_SIZE = 50
+
+# The results file served for each ?format=, relative to the records file
+FORMATS = {
+    'records': lambda filename: filename,
+    'columns': output.columns_filename,
+    'index': similarity_index.index_filename,
+}
+
+_RESULTS_FILE = re.compile(r'^fpl_team_similarity_(\d+)_gw(\d+)\.json$')
+_SIMILARITY_PATH = re.compile(r'^/api/similarity/(\d+)/(\d+)/?$')
+
+
+class ServiceBusy(RuntimeError):
+    """Raised when a result is missing and too many computations are already pending."""
+
+
+class ComputationFailed(RuntimeError):
+    """Raised when the results of a league and gameweek could not be computed."""
+
+
+class LeagueNotFound(LookupError):
+    """Raised when the FPL API has no league with the requested ID."""
+
+
+class LeagueTooLarge(RuntimeError):
+    """Raised when a league has more teams than the service computes on demand."""
+
+
+class StoredResult:
+    """The bookkeeping of one (league, gameweek) in the store."""
+
+    __slots__ = ('size', 'computed_at', 'final')
+
+    def __init__(self, size, computed_at, final):
+        self.size = size
+        self.computed_at = computed_at
+        self.final = final
+
+
+def result_files(league_id, gameweek):
+    """Returns the paths of every file of a league and gameweek's results, existing or not."""
+    filename = pipeline.results_filename(league_id, gameweek)
+    paths = [name(filename) for name in FORMATS.values()]
+    return paths + [f'{path}.gz' for path in paths]
+
+
+class ResultStore:
+    """
+    Tracks the results in the data directory, least recently used first.
+
+    Args:
+        max_bytes (int): Size of the store; least recently used results are
+            deleted beyond it.
+        ttl (float): Seconds before results computed before their gameweek
+            finished are considered stale.
+        pinned (iterable): League IDs whose results are never evicted nor
+            considered stale, as the daemon refreshes them.
+    """
+
+    def __init__(self, max_bytes=MAX_STORE_BYTES, ttl=CURRENT_GAMEWEEK_TTL, pinned=()):
+        self.max_bytes = max_bytes
+        self.max_league_bytes = int(max_bytes * MAX_LEAGUE_SHARE)
+        self.ttl = ttl
+        self.pinned = set(pinned)
+        self.total_bytes = 0
+        self.leagues = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def league_costs(self, league_id):
+        """Returns the cost accounting of a league, creating it on first use."""
+        return self.leagues.setdefault(league_id, {
+            'bytes': 0, 'results': 0, 'hits': 0, 'computations': 0, 'compute_seconds': 0.0, 'evictions': 0,
+        })
+
+    def scan(self, current_gameweek):
+        """
+        Adds the results already in the data directory, oldest first.
+
+        Results of past gameweeks are taken as final; those of the current
+        gameweek are stale once older than the TTL.
+        """
+        found = []
+        for name in os.listdir(pipeline.DATA_DIRECTORY):
+            match = _RESULTS_FILE.match(name)
+            if match:
+                league_id, gameweek = map(int, match.groups())
+                found.append((os.path.getmtime(os.path.join(pipeline.DATA_DIRECTORY, name)), league_id, gameweek))
+        for computed_at, league_id, gameweek in sorted(found):
+            self.add(league_id, gameweek, final=gameweek < current_gameweek, computed_at=computed_at)
+
+    def add(self, league_id, gameweek, final, computed_at=None, compute_seconds=None):
+        """Records newly written results and evicts others if the store is over budget."""
+        size = sum(os.path.getsize(path) for path in result_files(league_id, gameweek) if os.path.exists(path))
+        with self._lock:
+            self._remove(league_id, gameweek)
+            self._entries[(league_id, gameweek)] = StoredResult(size, computed_at or time.time(), final)
+            costs = self.league_costs(league_id)
+            costs['bytes'] += size
+            costs['results'] += 1
+            if compute_seconds is not None:
+                costs['computations'] += 1
+                costs['compute_seconds'] += compute_seconds
+            self.total_bytes += size
+            self._evict()
+
+    def lookup(self, league_id, gameweek, current_gameweek, finished_since=None):
+        """
+        Returns 'fresh', 'stale' or None if the store has no results for the league and gameweek.
+
+        Results computed before their gameweek finished are stale once the
+        gameweek is over or the TTL has passed. Results written by the batch or
+        the daemon since the store was scanned are added on first lookup, as
+        final if they are of a past gameweek or were written after
+        `finished_since`, the time the current gameweek was first seen finished.
+        """
+        try:
+            modified_at = os.path.getmtime(pipeline.results_filename(league_id, gameweek))
+        except FileNotFoundError:
+            with self._lock:
+                self._remove(league_id, gameweek)
+            return None
+        with self._lock:
+            entry = self._entries.get((league_id, gameweek))
+        if entry is None or modified_at > entry.computed_at:
+            final = gameweek < current_gameweek or (finished_since is not None and modified_at >= finished_since)
+            self.add(league_id, gameweek, final=final, computed_at=modified_at)
+            with self._lock:
+                entry = self._entries.get((league_id, gameweek))
+            if entry is None:  # Evicted straight away
+                return None
+        if entry.final or league_id in self.pinned or (gameweek == current_gameweek and time.time() - entry.computed_at < self.ttl):
+            return 'fresh'
+        return 'stale'
+
+    def read(self, league_id, gameweek, format='records', gzip=False):
+        """
+        Returns the content of one results file, preferring its gzip copy if `gzip` is set.
+
+        Returns:
+            tuple: (content, whether it is gzip-compressed).
+
+        Raises:
+            FileNotFoundError: If the results were evicted in the meantime.
+        """
+        path = FORMATS[format](pipeline.results_filename(league_id, gameweek))
+        candidates = [(f'{path}.gz', True), (path, False)] if gzip else [(path, False)]
+        for candidate, compressed in candidates:
+            try:
+                with open(candidate, 'rb') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                if (league_id, gameweek) in self._entries:
+                    self._entries.move_to_end((league_id, gameweek))
+                self.league_costs(league_id)['hits'] += 1
+            return content, compressed
+        raise FileNotFoundError(path)
+
+    def status(self):
+        """Returns the store's size and the cost accounting of every league."""
+        with self._lock:
+            return {
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'results': len(self._entries),
+                'leagues': {league_id: dict(costs) for league_id, costs in self.leagues.items()},
+            }
+
+    def _remove(self, league_id, gameweek):
+        entry = self._entries.pop((league_id, gameweek), None)
+        if entry is not None:
+            costs = self.league_costs(league_id)
+            costs['bytes'] -= entry.size
+            costs['results'] -= 1
+            self.total_bytes -= entry.size
+        return entry
+
+    def _evict(self):
+        # Least recently used first, from the leagues over their share first
+        while self.total_bytes > self.max_bytes:
+            evictable = [key for key in self._entries if key[0] not in self.pinned]
+            if not evictable:
+                return
+            over_share = [key for key in evictable if self.leagues[key[0]]['bytes'] > self.max_league_bytes]
+            league_id, gameweek = (over_share or evictable)[0]
+            self._remove(league_id, gameweek)
+            self.league_costs(league_id)['evictions'] += 1
+            metrics.increment('service_evictions')
+            paths = result_files(league_id, gameweek)
+            if self.leagues[league_id]['results'] == 0:
+                paths.append(pipeline.managers_filename(league_id))
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+class SimilarityService:
+    """
+    Answers requests from the store and computes missing results in the background.
+
+    Args:
+        store (ResultStore): Where results are looked up and recorded.
+        workers (int): Computations run at once.
+        jobs (int): Worker processes shared by the computations for the CPU-bound steps.
+        backend (str): The embedding backend to use.
+        incremental (bool): Whether to warm-start from the previous gameweek's layout.
+        max_pending (int): Computations queued or running before misses are refused.
+        max_entries (int): Teams in the largest league computed on demand.
+    """
+
+    def __init__(self, store, workers=2, jobs=1, backend=pipeline.embedding_backend, incremental=pipeline.incremental_embedding,
+                 max_pending=MAX_PENDING, max_entries=MAX_ENTRIES):
+        self.store = store
+        self.jobs = jobs
+        self.backend = backend
+        self.incremental = incremental
+        self.max_pending = max_pending
+        self.max_entries = max_entries
+        self._compute_pool = ThreadPoolExecutor(max_workers=workers)
+        self._cpu_pool = pipeline.worker_pool(jobs)
+        self._in_flight = {}
+        self._failures = {}
+        self._checked_leagues = {}
+        self._lock = threading.Lock()
+        self._season = None
+        self._season_fetched_at = 0.0
+        self._finished_since = None
+        self._season_lock = threading.Lock()
+
+    def close(self):
+        self._compute_pool.shutdown(cancel_futures=True)
+        self._cpu_pool.shutdown(cancel_futures=True)
+
+    def season(self):
+        """Returns fetch_player_data's result, refetched at most every SEASON_TTL seconds."""
+        with self._season_lock:
+            if self._season is None or time.monotonic() - self._season_fetched_at >= SEASON_TTL:
+                self._season = pipeline.fetch_player_data()
+                self._season_fetched_at = time.monotonic()
+                _, _, finished = self._season
+                if not finished:
+                    self._finished_since = None
+                elif self._finished_since is None:
+                    self._finished_since = time.time()
+            return self._season
+
+    @property
+    def finished_since(self):
+        """When the current gameweek was first seen finished, or None while it is live."""
+        with self._season_lock:
+            return self._finished_since
+
+    def result(self, league_id, gameweek, wait=DEFAULT_WAIT):
+        """
+        Makes sure the results of a league and gameweek are available, computing them if needed.
+
+        Args:
+            league_id (int): The league ID.
+            gameweek (int): The gameweek number.
+            wait (float): Seconds to wait for a computation to finish.
+
+        Returns:
+            str: 'fresh' or 'stale' (being recomputed) once the results can be
+            read from the store, or None if they are still being computed.
+
+        Raises:
+            ValueError: If the gameweek has not started yet.
+            LeagueNotFound: If the league does not exist.
+            LeagueTooLarge: If the league has more than `max_entries` teams.
+            ServiceBusy: If too many computations are pending to start another.
+            ComputationFailed: If the computation failed, now or within FAILURE_TTL.
+        """
+        metrics.increment('service_requests')
+        season = self.season()
+        _, current_gameweek, _ = season
+        if not 1 <= gameweek <= current_gameweek:
+            raise ValueError(f"Gameweek must be between 1 and the current gameweek ({current_gameweek}), got {gameweek}")
+
+        state = self.store.lookup(league_id, gameweek, current_gameweek, self.finished_since)
+        if state == 'fresh':
+            metrics.increment('service_hits')
+            return state
+        if state == 'stale':
+            metrics.increment('service_stale_hits')
+            try:
+                self._submit(league_id, gameweek, season)
+            except (ServiceBusy, ComputationFailed):
+                pass  # The stale results are still served
+            return state
+
+        metrics.increment('service_misses')
+        self.check_league(league_id)
+        future = self._submit(league_id, gameweek, season)
+        wait_futures([future], timeout=wait)
+        if not future.done():
+            return None
+        future.result()  # Raises ComputationFailed
+        return 'fresh'
+
+    def check_league(self, league_id):
+        """
+        Makes sure a league exists and is small enough before its results are computed.
+
+        Reads the first page of the standings and, if it is full, the page
+        holding the team after the `max_entries`th. The daemon's leagues are
+        not checked, and verdicts are reused for SEASON_TTL seconds.
+
+        Raises:
+            LeagueNotFound: If the league does not exist.
+            LeagueTooLarge: If the league has more than `max_entries` teams.
+        """
+        if league_id in self.store.pinned:
+            return
+        with self._lock:
+            checked = self._checked_leagues.get(league_id)
+        if checked is None or time.monotonic() - checked[0] >= SEASON_TTL:
+            error = None
+            try:
+                self._check_standings(league_id)
+            except (LeagueNotFound, LeagueTooLarge) as e:
+                error = e
+            checked = (time.monotonic(), error)
+            with self._lock:
+                self._checked_leagues[league_id] = checked
+        if checked[1] is not None:
+            raise checked[1]
+
+    def _check_standings(self, league_id):
+        response = api.get(pipeline.league_standings_url(league_id))
+        if response.status_code == 404:
+            raise LeagueNotFound(f"League {league_id} does not exist")
+        response.raise_for_status()
+        teams = len(pipeline.extract_manager_data(response.json()))
+        page, position = divmod(self.max_entries, STANDINGS_PAGE_SIZE)
+        if page > 0 and teams == STANDINGS_PAGE_SIZE:
+            # Pages past the end of the standings are empty (or missing from fixtures)
+            response = api.get(pipeline.league_standings_url(league_id, page + 1))
+            if response.status_code == 404:
+                return
+            response.raise_for_status()
+            teams = len(pipeline.extract_manager_data(response.json()))
+        elif page > 0:
+            return
+        if teams > position:
+            raise LeagueTooLarge(f"League {league_id} has more than {self.max_entries} teams")
+
+    def pending(self):
+        """Returns the (league, gameweek) pairs being computed."""
+        with self._lock:
+            return sorted(self._in_flight)
+
+    def status(self):
+        """Returns the store's status, the pending computations and the service counters."""
+        counters = metrics.snapshot()['counters']
+        return {
+            'store': self.store.status(),
+            'pending': self.pending(),
+            'counters': {name: value for name, value in counters.items() if name.startswith('service_')},
+        }
+
+    def _submit(self, league_id, gameweek, season):
+        """Returns the computation of a league and gameweek, starting it unless already running."""
+        key = (league_id, gameweek)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                metrics.increment('service_deduplicated')
+                return future
+            failure = self._failures.get(key)
+            if failure is not None and time.monotonic() - failure[0] < FAILURE_TTL:
+                raise ComputationFailed(failure[1])
+            if len(self._in_flight) >= self.max_pending:
+                raise ServiceBusy(f"{len(self._in_flight)} computations pending")
+            future = self._in_flight[key] = self._compute_pool.submit(self._compute, league_id, gameweek, season)
+            return future
+
+    def _compute(self, league_id, gameweek, season):
+        _, current_gameweek, current_gameweek_finished = season
+        start = time.perf_counter()
+        try:
+            failed = pipeline.run_batch([league_id], str(gameweek), jobs=self.jobs, force=True, backend=self.backend,
+                                        incremental=self.incremental, season=season, executor=self._cpu_pool,
+                                        record_history=False)
+            if failed:
+                raise ComputationFailed(f"Computing league {league_id} gameweek {gameweek} failed")
+            if not os.path.exists(pipeline.results_filename(league_id, gameweek)):
+                raise ComputationFailed(f"League {league_id} has no teams in gameweek {gameweek}")
+            final = gameweek < current_gameweek or current_gameweek_finished
+            self.store.add(league_id, gameweek, final, compute_seconds=time.perf_counter() - start)
+            metrics.increment('service_computations')
+        except Exception as e:
+            metrics.increment('service_failures')
+            with self._lock:
+                self._failures[(league_id, gameweek)] = (time.monotonic(), str(e))
+            if isinstance(e, ComputationFailed):
+                raise
+            raise ComputationFailed(f"Computing league {league_id} gameweek {gameweek} failed: {e}") from e
+        finally:
+            with self._lock:
+                del self._in_flight[(league_id, gameweek)]
+
+
+def make_handler(service):
+    """Returns a request handler class answering the service's endpoints."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = parse_qs(parts.query)
+            if parts.path.rstrip('/') == '/api/status':
+                self._send_json(200, service.status())
+                return
+            match = _SIMILARITY_PATH.match(parts.path)
+            if not match:
+                self._send_json(404, {'error': 'Not found'})
+                return
+            league_id, gameweek = map(int, match.groups())
+            format = query.get('format', ['records'])[0]
+            if format not in FORMATS:
+                self._send_json(400, {'error': f"format must be one of {', '.join(FORMATS)}"})
+                return
+            try:
+                wait = min(float(query.get('wait', [DEFAULT_WAIT])[0]), MAX_WAIT)
+            except ValueError:
+                self._send_json(400, {'error': 'wait must be a number of seconds'})
+                return
+
+            try:
+                state = service.result(league_id, gameweek, wait)
+                if state is None:
+                    self._send_json(202, {'status': 'pending', 'league_id': league_id, 'gameweek': gameweek}, {'Retry-After': '5'})
+                    return
+                content, compressed = service.store.read(league_id, gameweek, format, 'gzip' in self.headers.get('Accept-Encoding', ''))
+            except (ValueError, LeagueNotFound) as e:
+                self._send_json(404, {'error': str(e)})
+                return
+            except LeagueTooLarge as e:
+                self._send_json(422, {'error': str(e)})
+                return
+            except (ServiceBusy, FileNotFoundError) as e:
+                self._send_json(503, {'error': str(e) or 'Results were evicted, retry'}, {'Retry-After': '30'})
+                return
+            except Exception as e:  # ComputationFailed, or the FPL API is unreachable
+                self._send_json(502, {'error': str(e)})
+                return
+
+            headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding', 'X-Similarity-State': state}
+            if compressed:
+                headers['Content-Encoding'] = 'gzip'
+            self._send(200, content, headers)
+
+        def _send_json(self, status, payload, headers=None):
+            self._send(status, json.dumps(payload).encode('utf-8'), headers)
+
+        def _send(self, status, body, headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    """Command line entry point; see --help."""
+    parser = argparse.ArgumentParser(description="Serve FPL league similarity results for any league, computing them on demand.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=8082, help="Port to listen on (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=2, help="Computations run at once (default: %(default)s)")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="Worker processes for vectorizing and embedding (default: %(default)s)")
+    parser.add_argument('--backend', choices=embedding.EMBEDDING_BACKENDS, default=pipeline.embedding_backend, help="Embedding backend (default: %(default)s)")
+    parser.add_argument('--no-incremental', dest='incremental', action='store_false', default=pipeline.incremental_embedding, help="Do not warm-start from the previous gameweek's layout")
+    parser.add_argument('--max-mib', type=float, default=MAX_STORE_BYTES / 2**20, help="Size of the results store in MiB (default: %(default)s)")
+    parser.add_argument('--ttl', type=float, default=CURRENT_GAMEWEEK_TTL, help="Seconds before results of an unfinished gameweek are recomputed (default: %(default)s)")
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING, help="Computations queued or running at once (default: %(default)s)")
+    parser.add_argument('--max-entries', type=int, default=MAX_ENTRIES, help="Teams in the largest league computed on demand (default: %(default)s)")
+    parser.add_argument('--pinned', type=int, nargs='*', default=pipeline.league_ids, help="Leagues never evicted (default: %(default)s)")
+    parser.add_argument('--requests-per-second', type=float, help="FPL API request rate limit (default: %s)" % api.REQUESTS_PER_SECOND)
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.jobs < 1:
+        parser.error("--workers and --jobs must be at least 1")
+    if args.requests_per_second:
+        api.configure(requests_per_second=args.requests_per_second)
+    os.makedirs(pipeline.DATA_DIRECTORY, exist_ok=True)
+    os.makedirs(pipeline.CACHE_DIRECTORY, exist_ok=True)
+
+    store = ResultStore(int(args.max_mib * 2**20), args.ttl, args.pinned)
+    service = SimilarityService(store, args.workers, args.jobs, args.backend, args.incremental, args.max_pending, args.max_entries)
+    _, current_gameweek, _ = service.season()
+    store.scan(current_gameweek)
+    print(f"{store.status()['results']} results in '{pipeline.DATA_DIRECTORY}' ({store.total_bytes / 2**20:.1f} MiB)")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
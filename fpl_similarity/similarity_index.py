@@ -0,0 +1,196 @@
+"""
+Precomputed ownership and similarity index for one league and gameweek.
+
+Saved as fpl_team_similarity_{league}_gw{N}.index.json next to the results, it
+answers the usual questions with a dictionary lookup instead of a scan over
+every team:
+
+* ownership: for each player, the IDs of the teams owning them, the share of
+  teams owning them and their effective ownership (captain counts double,
+  Triple Captain triple, benched players not at all unless Bench Boost is on).
+* team_groups: for each team ID, the index of its group of identical teams in
+  the results file.
+* neighbours: for each group, the NEIGHBOURS most similar other groups and
+  their cosine similarity, from an exact search over the weighted team
+  vectors, computed in blocks (see nearest_neighbours).
+* templates: for each group, the label of its template cluster (groups of
+  near-identical teams, see ann.TeamIndex.template_clusters), or -1.
+"""
+import json
+import os
+
+import numpy as np
+
+from fpl_similarity import ann, output
+
+INDEX_FORMAT = 'fpl-similarity-index'
+INDEX_VERSION = 1
+
+NEIGHBOURS = 10
+SIMILARITY_DIGITS = 4
+
+# Upper bound on the entries of each block of the similarity matrix, which
+# keeps memory flat however large the league is
+MAX_BLOCK_ENTRIES = 1 << 23
+
+
+def index_filename(filename):
+    """Returns the index filename that goes with a records filename."""
+    base, _ = os.path.splitext(filename)
+    return f'{base}.index.json'
+
+
+def ownership(elements, positions, counts, captains, active_chips, team_ids):
+    """
+    Computes the ownership of every player across the teams of a league.
+
+    The teams are given once per group of identical teams, with the IDs of all
+    the teams in the group.
+
+    Args:
+        elements (np.ndarray): The player ID of every pick, group after group.
+        positions (np.ndarray): The squad position (1-15) of every pick.
+        counts (np.ndarray): The number of picks of each group.
+        captains (list): The captain's player ID for each group.
+        active_chips (list): The active chip (or None) for each group.
+        team_ids (list): For each group, the IDs of its teams.
+
+    Returns:
+        dict: Player ID -> {'team_ids', 'owned_pct', 'eo_pct'}.
+    """
+    group_sizes = np.fromiter((len(ids) for ids in team_ids), dtype=np.int64, count=len(team_ids))
+    n_teams = int(group_sizes.sum())
+    if n_teams == 0:
+        return {}
+
+    chips = np.asarray(active_chips, dtype=object)
+    bench_boost = np.repeat(chips == 'bboost', counts)
+    triple_captain = np.repeat(chips == '3xc', counts)
+    is_captain = elements == np.repeat(np.asarray(captains, dtype=np.int64), counts)
+    multipliers = np.where(bench_boost | (positions <= 11), 1, 0)
+    multipliers = multipliers * np.where(is_captain, np.where(triple_captain, 3, 2), 1)
+
+    groups = np.repeat(np.arange(len(counts)), counts)
+    order = np.argsort(elements, kind='stable')
+    player_ids, starts, owning_groups = np.unique(elements[order], return_index=True, return_counts=True)
+    pick_teams = group_sizes[groups[order]]
+    owned = np.add.reduceat(pick_teams, starts)
+    eo = np.add.reduceat(multipliers[order] * pick_teams, starts)
+
+    index = {}
+    for player_id, start, n_groups, n_owned, player_eo in zip(player_ids, starts, owning_groups, owned, eo):
+        index[int(player_id)] = {
+            'team_ids': [team_id for group in groups[order[start:start + n_groups]] for team_id in team_ids[group]],
+            'owned_pct': round(100.0 * n_owned / n_teams, 2),
+            'eo_pct': round(100.0 * player_eo / n_teams, 2),
+        }
+    return index
+
+
+def nearest_neighbours(vectors, k=NEIGHBOURS):
+    """
+    Finds the k most similar rows of each row by cosine similarity.
+
+    The similarity matrix is computed as a sparse matrix product, one block of
+    rows at a time.
+
+    Args:
+        vectors (scipy.sparse matrix): One row per unique team.
+        k (int): Number of neighbours per row.
+
+    Returns:
+        tuple: A tuple containing:
+            - np.ndarray: (n, k) neighbour row indexes, most similar first.
+            - np.ndarray: (n, k) cosine similarities.
+    """
+    from scipy import sparse
+
+    vectors = sparse.csr_matrix(vectors, dtype=np.float64)
+    n_rows = vectors.shape[0]
+    k = min(k, n_rows - 1)
+    if k <= 0:
+        return np.empty((n_rows, 0), dtype=np.int64), np.empty((n_rows, 0))
+
+    norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = sparse.diags(1.0 / norms) @ vectors
+    normalized_t = normalized.T.tocsr()
+
+    neighbours = np.empty((n_rows, k), dtype=np.int64)
+    scores = np.empty((n_rows, k))
+    block = max(1, MAX_BLOCK_ENTRIES // n_rows)
+    for start in range(0, n_rows, block):
+        end = min(n_rows, start + block)
+        similarities = (normalized[start:end] @ normalized_t).toarray()
+        similarities[np.arange(end - start), np.arange(start, end)] = -np.inf  # Exclude the row itself
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        neighbours[start:end] = np.take_along_axis(top, order, axis=1)
+        scores[start:end] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbours, scores
+
+
+def build_index(groups, unique_vectors, k=NEIGHBOURS):
+    """
+    Builds the index for one league and gameweek.
+
+    Args:
+        groups (grouping.TeamGroups): The league's teams, grouped.
+        unique_vectors (scipy.sparse matrix): The weighted vector of each group.
+        k (int): Number of neighbours stored per group.
+
+    Returns:
+        dict: The index, ready to be saved as JSON.
+    """
+    records = groups.records
+    elements, positions, counts = groups.squads()
+    neighbours, scores = nearest_neighbours(unique_vectors, k)
+    return {
+        'format': INDEX_FORMAT,
+        'version': INDEX_VERSION,
+        'teams': groups.n_teams,
+        'ownership': ownership(
+            elements, positions, counts,
+            [record['captain'] for record in records],
+            [record['active_chip'] for record in records],
+            [record['team_ids'] for record in records],
+        ),
+        'team_groups': {
+            team_id: group
+            for group, record in enumerate(records)
+            for team_id in record['team_ids']
+        },
+        'neighbours': {
+            'metric': 'cosine',
+            'k': neighbours.shape[1],
+            'groups': neighbours.tolist(),
+            'similarity': np.round(scores, SIMILARITY_DIGITS).tolist(),
+        },
+        'templates': ann.TeamIndex(unique_vectors).template_clusters().tolist(),
+    }
+
+
+def write_index(index, filename, compress=True):
+    """
+    Saves an index as JSON, with a gzip-precompressed copy.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    content = json.dumps(index, separators=(',', ':')).encode('utf-8')
+    return output.write_atomic(filename, content, compress)
+
+
+def load_index(filename):
+    """
+    Loads a saved index, converting its JSON string keys back to integer IDs.
+
+    Returns:
+        dict: The index, with integer keys in 'ownership' and 'team_groups'.
+    """
+    with open(filename, 'r') as f:
+        index = json.load(f)
+    index['ownership'] = {int(player_id): entry for player_id, entry in index['ownership'].items()}
+    index['team_groups'] = {int(team_id): group for team_id, group in index['team_groups'].items()}
+    return index
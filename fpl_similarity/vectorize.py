@@ -0,0 +1,132 @@
+"""
+Builds the weighted team vectors for a whole league as one sparse matrix.
+
+Each row is a team and each column a player owned by at least one team in the
+league. A player's weight is their scaled price, multiplied by the weight of
+their squad position and by the captain bonus:
+
+* scaled price: (price / 15) ** 2, with a default price of 4.0
+* position: 1 for the starting XI (and for everyone under Bench Boost), 0.1 on the bench
+* captain: x1.5, or x2.0 with Triple Captain
+"""
+import numpy as np
+
+DEFAULT_PRICE = 4.0
+BENCH_WEIGHT = 0.1
+CAPTAIN_WEIGHT = 1.5
+TRIPLE_CAPTAIN_WEIGHT = 2.0
+
+
+def price_lookup(player_prices):
+    """
+    Converts a player ID -> price mapping into an array indexed by player ID.
+
+    IDs missing from `player_prices` get DEFAULT_PRICE.
+
+    Args:
+        player_prices (dict): Player ID -> price.
+
+    Returns:
+        np.ndarray: Prices indexed by player ID.
+    """
+    max_id = max(player_prices, default=0)
+    prices = np.full(max_id + 1, DEFAULT_PRICE)
+    if player_prices:
+        prices[np.fromiter(player_prices.keys(), dtype=np.int64)] = np.fromiter(player_prices.values(), dtype=float)
+    return prices
+
+
+def flatten_teams(teams):
+    """
+    Flattens the picks of many teams into flat arrays.
+
+    Args:
+        teams (list): For each team, a list of (player_id, position) tuples.
+
+    Returns:
+        tuple: A tuple containing:
+            - np.ndarray: The player ID of every pick, team after team.
+            - np.ndarray: The squad position (1-15) of every pick.
+            - np.ndarray: The number of picks of each team.
+    """
+    counts = np.fromiter((len(team) for team in teams), dtype=np.int64, count=len(teams))
+    n_picks = int(counts.sum())
+    elements = np.empty(n_picks, dtype=np.int64)
+    positions = np.empty(n_picks, dtype=np.int64)
+    i = 0
+    for team in teams:
+        for player_id, position in team:
+            elements[i] = player_id
+            positions[i] = position
+            i += 1
+    return elements, positions, counts
+
+
+def build_team_matrix(teams, captains, active_chips, player_prices):
+    """
+    Builds the weighted vectors of all teams in one vectorized pass.
+
+    Args:
+        teams (list): For each team, a list of (player_id, position) tuples.
+        captains (list): The captain's player ID for each team.
+        active_chips (list): The active chip (or None) for each team.
+        player_prices (dict or np.ndarray): Player ID -> price, either as a
+            mapping or as an array from `price_lookup`.
+
+    Returns:
+        tuple: A tuple containing:
+            - scipy.sparse.csr_matrix: One row per team, one column per player.
+            - np.ndarray: The player ID of each column.
+    """
+    elements, positions, counts = flatten_teams(teams)
+    return weighted_matrix(elements, positions, counts, captains, active_chips, player_prices)
+
+
+def weighted_matrix(elements, positions, counts, captains, active_chips, player_prices):
+    """
+    Builds the weighted team vectors from teams already flattened into arrays.
+
+    Args:
+        elements (np.ndarray): The player ID of every pick, team after team.
+        positions (np.ndarray): The squad position (1-15) of every pick.
+        counts (np.ndarray): The number of picks of each team.
+        captains (list): The captain's player ID for each team.
+        active_chips (list): The active chip (or None) for each team.
+        player_prices (dict or np.ndarray): As for `build_team_matrix`.
+
+    Returns:
+        tuple: The same as `build_team_matrix`.
+    """
+    from scipy import sparse
+
+    if not isinstance(player_prices, np.ndarray):
+        player_prices = price_lookup(player_prices)
+
+    elements = np.asarray(elements, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    n_teams = len(counts)
+    n_picks = len(elements)
+    rows = np.repeat(np.arange(n_teams), counts)
+    player_ids, columns = np.unique(elements, return_inverse=True)
+
+    # Players missing from the price table fall back to the default price
+    known = elements < len(player_prices)
+    prices = np.full(n_picks, DEFAULT_PRICE)
+    prices[known] = player_prices[elements[known]]
+    scaled_price = (prices / 15.0) ** 2
+
+    chips = np.asarray(active_chips, dtype=object)
+    bench_boost = np.repeat(chips == 'bboost', counts)
+    triple_captain = np.repeat(chips == '3xc', counts)
+    is_captain = elements == np.repeat(np.asarray(captains, dtype=np.int64), counts)
+
+    position_weight = np.where(bench_boost | (positions <= 11), 1.0, BENCH_WEIGHT)
+    position_weight *= np.where(is_captain, np.where(triple_captain, TRIPLE_CAPTAIN_WEIGHT, CAPTAIN_WEIGHT), 1.0)
+
+    matrix = sparse.csr_matrix(
+        (scaled_price * position_weight, (rows, columns)),
+        shape=(n_teams, len(player_ids)),
+    )
+    matrix.sort_indices()
+    return matrix, player_ids
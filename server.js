@@ -1,18 +1,85 @@
 const express = require("express");
+const http = require("http");
 const path = require("path");
 const app = express();
 const port = process.env.PORT || 3000;
 
+const browserDir = path.join(__dirname, "dist/fpl-league-similarity/browser");
+
+// With FPL_DATA_DIRECTORY set, the JSON assets written by the refresh daemon
+// (fpl_similarity/daemon.py) are served from that directory, ahead of the copies
+// bundled with the build, so new results are live without a rebuild or restart
+const assetRoots = [path.join(browserDir, "assets")];
+if (process.env.FPL_DATA_DIRECTORY) {
+  assetRoots.unshift(path.resolve(process.env.FPL_DATA_DIRECTORY));
+}
+
+// Serve the gzip-precompressed copies of the JSON assets to clients that accept gzip
+app.get(/^\/assets\/.+\.json$/, (req, res, next) => {
+  if (!req.acceptsEncodings("gzip")) {
+    return next();
+  }
+  const file = `${req.path.slice("/assets".length)}.gz`;
+  const sendFrom = (index) => {
+    if (index === assetRoots.length) {
+      return next();
+    }
+    res.sendFile(
+      file,
+      {
+        root: assetRoots[index],
+        headers: {
+          "Content-Encoding": "gzip",
+          "Content-Type": "application/json; charset=utf-8",
+          Vary: "Accept-Encoding",
+        },
+      },
+      (err) => {
+        if (err && !res.headersSent) {
+          sendFrom(index + 1);
+        }
+      }
+    );
+  };
+  sendFrom(0);
+});
+
+if (process.env.FPL_DATA_DIRECTORY) {
+  app.use("/assets", express.static(assetRoots[0]));
+}
+
+// Forward /api to the on-demand similarity service (fpl_similarity/service.py) when configured
+if (process.env.FPL_SIMILARITY_API) {
+  const upstreamUrl = new URL(process.env.FPL_SIMILARITY_API);
+  app.use("/api", (req, res) => {
+    const upstream = http.request(
+      {
+        hostname: upstreamUrl.hostname,
+        port: upstreamUrl.port,
+        path: req.originalUrl,
+        method: req.method,
+        headers: req.headers,
+      },
+      (response) => {
+        res.writeHead(response.statusCode, response.headers);
+        response.pipe(res);
+      }
+    );
+    upstream.on("error", () => {
+      if (!res.headersSent) {
+        res.status(502).json({ error: "Similarity service unavailable" });
+      }
+    });
+    req.pipe(upstream);
+  });
+}
+
 // Serve static files from the Angular app build directory
-app.use(
-  express.static(path.join(__dirname, "dist/fpl-league-similarity/browser"))
-);
+app.use(express.static(browserDir));
 
 // Send all other requests to the Angular app
 app.get("*", (req, res) => {
-  res.sendFile(
-    path.join(__dirname, "dist/fpl-league-similarity/browser/index.html")
-  );
+  res.sendFile(path.join(browserDir, "index.html"));
 });
 
 app.listen(port, () => {
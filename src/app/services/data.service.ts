@@ -42,6 +42,77 @@ export interface League {
   name: string;
 }
 
+// Column-oriented form of ManagerData[] written next to the records file as
+// fpl_team_similarity_{league}_gw{N}.columns.json. Names and chips are
+// dictionary-encoded and per-group lists are flattened with offsets.
+export interface ColumnarManagerData {
+  format: 'fpl-similarity-columns';
+  version: number;
+  groups: number;
+  dictionaries: {
+    manager_names: string[];
+    team_names: string[];
+    active_chip: string[];
+  };
+  columns: {
+    team_offsets: number[];
+    team_ids: number[];
+    manager_names: number[];
+    team_names: number[];
+    player_offsets: number[];
+    players_owned: number[];
+    active_chip: number[];
+    captain: number[];
+    vice_captain: number[];
+    total_points: number[];
+    rank: number[];
+    gw_points: number[];
+    gw_rank: number[];
+    pca_x: number[];
+    pca_y: number[];
+    tsne_x: number[];
+    tsne_y: number[];
+  };
+}
+
+export function decodeColumnarManagerData(
+  data: ColumnarManagerData
+): ManagerData[] {
+  const { dictionaries, columns } = data;
+  const managers: ManagerData[] = new Array(data.groups);
+  for (let i = 0; i < data.groups; i++) {
+    const start = columns.team_offsets[i];
+    const end = columns.team_offsets[i + 1];
+    const chip = columns.active_chip[i];
+    managers[i] = {
+      manager_names: columns.manager_names
+        .slice(start, end)
+        .map((code) => dictionaries.manager_names[code]),
+      team_names: columns.team_names
+        .slice(start, end)
+        .map((code) => dictionaries.team_names[code]),
+      team_ids: columns.team_ids.slice(start, end),
+      manager_count: end - start,
+      captain: columns.captain[i],
+      vice_captain: columns.vice_captain[i],
+      total_points: columns.total_points[i],
+      rank: columns.rank[i],
+      gw_points: columns.gw_points[i],
+      gw_rank: columns.gw_rank[i],
+      players_owned: columns.players_owned.slice(
+        columns.player_offsets[i],
+        columns.player_offsets[i + 1]
+      ),
+      pca_x: columns.pca_x[i],
+      pca_y: columns.pca_y[i],
+      tsne_x: columns.tsne_x[i],
+      tsne_y: columns.tsne_y[i],
+      active_chip: chip < 0 ? null : dictionaries.active_chip[chip],
+    };
+  }
+  return managers;
+}
+
 @Injectable({
   providedIn: 'root',
 })
@@ -144,9 +215,17 @@ export class DataService {
   loadManagerData(gameweek: number, leagueId: number): void {
     if (gameweek < 1) return;
     this.setLoading(true);
-    const filename = `fpl_team_similarity_${leagueId}_gw${gameweek}.json`;
-    fetch(`/assets/${filename}`)
-      .then((response) => response.json())
+    const basename = `fpl_team_similarity_${leagueId}_gw${gameweek}`;
+    // Prefer the compact columnar file; older gameweeks only have the records file
+    fetch(`/assets/${basename}.columns.json`)
+      .then((response) => {
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.json();
+      })
+      .then((data: ColumnarManagerData) => decodeColumnarManagerData(data))
+      .catch(() =>
+        fetch(`/assets/${basename}.json`).then((response) => response.json())
+      )
       .then((data: ManagerData[]) => {
         console.log(
           `Loaded manager data for league ${leagueId}, gameweek ${gameweek}`
@@ -0,0 +1,151 @@
+"""
+TeamGroups.add_batch must group a gameweek exactly as adding its teams one by one with add.
+"""
+import random
+
+import numpy as np
+import pytest
+
+from fpl_similarity import grouping, records
+
+CHIPS = [None, None, None, 'bboost', '3xc', 'freehit', 'wildcard']
+
+
+def make_picks(elements, positions=None, captain=None, vice_captain=None, chip=None, points=50, rank=1000):
+    """Builds a TeamPicks with the captain and vice-captain defaulting to the first two picks."""
+    elements = tuple(elements)
+    positions = tuple(positions) if positions is not None else tuple(range(1, len(elements) + 1))
+    return records.TeamPicks(
+        elements, positions,
+        elements[0] if captain is None else captain,
+        elements[1] if vice_captain is None else vice_captain,
+        points * 10, rank, points, rank // 10 or None, chip,
+    )
+
+
+def make_managers(n):
+    return [{'name': f'Manager {i}', 'team_name': f'Team {i}', 'team_id': 100 + i} for i in range(n)]
+
+
+def shuffled(picks, rng):
+    """The same team with its starting XI and its bench each listed in another order."""
+    order = rng.sample(range(11), 11) + [11 + i for i in rng.sample(range(4), 4)]
+    return make_picks(
+        [picks.elements[i] for i in order], [picks.positions[i] for i in order],
+        picks.captain, picks.vice_captain, picks.active_chip, picks.gw_points, picks.rank,
+    )
+
+
+def random_league(n, seed=0, templates=12, max_player_id=600, missing_rate=0.05):
+    """Managers sharing a few template squads, in varying pick order, captains and chips."""
+    rng = random.Random(seed)
+    squads = [rng.sample(range(1, max_player_id + 1), records.SQUAD_SIZE) for _ in range(templates)]
+    team_picks = []
+    for _ in range(n):
+        if rng.random() < missing_rate:
+            team_picks.append(None)
+            continue
+        if rng.random() < 0.2:
+            elements = rng.sample(range(1, max_player_id + 1), records.SQUAD_SIZE)
+        else:
+            elements = rng.choice(squads)
+        picks = make_picks(elements, captain=rng.choice(elements[:3]), vice_captain=elements[3],
+                           chip=rng.choice(CHIPS), points=rng.randrange(20, 90), rank=rng.randrange(1, 10**6))
+        team_picks.append(shuffled(picks, rng))
+    return team_picks
+
+
+def add_one_by_one(groups, managers, team_picks):
+    return np.array([-1 if picks is None else groups.add(manager, picks) for manager, picks in zip(managers, team_picks)])
+
+
+def assert_same_groups(team_picks, chunks=1, column_path=True):
+    """
+    Groups the teams with add and with add_batch, in `chunks` batches, into the same groups.
+
+    With `column_path`, add_batch must not fall back to adding the teams one by one.
+    """
+    managers = make_managers(len(team_picks))
+    one_by_one, batched = grouping.TeamGroups(), grouping.TeamGroups()
+    if column_path:
+        batched.add = None
+    bounds = np.linspace(0, len(team_picks), chunks + 1).astype(int)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        expected = add_one_by_one(one_by_one, managers[start:end], team_picks[start:end])
+        group_of = batched.add_batch(managers[start:end], records.PicksBatch.from_records(team_picks[start:end]))
+        assert group_of.tolist() == expected.tolist()
+    assert batched.records == one_by_one.records
+    for batched_column, expected_column in zip(batched.squads(), one_by_one.squads()):
+        np.testing.assert_array_equal(batched_column, expected_column)
+    assert batched.n_teams == one_by_one.n_teams
+    return batched
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_add_batch_matches_add(seed):
+    groups = assert_same_groups(random_league(300, seed))
+    assert len(groups) < groups.n_teams
+
+
+def test_add_batch_across_gameweek_batches():
+    assert_same_groups(random_league(400, seed=7), chunks=3)
+
+
+def test_add_batch_after_add():
+    team_picks = random_league(100, seed=3)
+    managers = make_managers(len(team_picks))
+    one_by_one, mixed = grouping.TeamGroups(), grouping.TeamGroups()
+    expected = add_one_by_one(one_by_one, managers, team_picks)
+    add_one_by_one(mixed, managers[:40], team_picks[:40])
+    mixed.add = None
+    group_of = mixed.add_batch(managers[40:], records.PicksBatch.from_records(team_picks[40:]))
+    assert group_of.tolist() == expected[40:].tolist()
+    assert mixed.records == one_by_one.records
+
+
+def test_large_player_ids():
+    # IDs of 2**16 and above cannot be packed four to a word
+    assert_same_groups(random_league(200, seed=11, max_player_id=70000))
+
+
+def test_chips_and_captains_split_groups():
+    elements = list(range(1, 16))
+    team_picks = [
+        make_picks(elements),
+        make_picks(elements, chip='bboost'),
+        make_picks(elements, chip='3xc'),
+        make_picks(elements, captain=5),
+        make_picks(elements),
+        make_picks(elements, chip='bboost'),
+        # The same players with a starter and a substitute swapped
+        make_picks(elements, positions=list(range(1, 11)) + [12, 11] + list(range(13, 16))),
+    ]
+    groups = assert_same_groups(team_picks)
+    assert [record['manager_count'] for record in groups.records] == [2, 2, 1, 1, 1]
+    assert [record['active_chip'] for record in groups.records] == [None, 'bboost', '3xc', None, None]
+
+
+@pytest.mark.parametrize('squad', [
+    # A short squad, padded in the batch
+    dict(elements=range(1, 15)),
+    # Twelve starters
+    dict(elements=range(1, 16), positions=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 11, 13, 14, 15]),
+    # No bench at all
+    dict(elements=range(1, 12)),
+])
+def test_odd_squad_shapes(squad):
+    team_picks = random_league(50, seed=5)
+    odd = make_picks(**squad)
+    team_picks[10] = odd
+    team_picks[30] = odd
+    groups = assert_same_groups(team_picks, column_path=False)
+    group = next(record for record in groups.records if record['players_owned'] == list(odd.elements))
+    assert group['manager_count'] == 2
+
+
+def test_no_picks():
+    managers = make_managers(3)
+    groups = grouping.TeamGroups()
+    group_of = groups.add_batch(managers, records.PicksBatch.from_records([None, None, None]))
+    assert group_of.tolist() == [-1, -1, -1]
+    assert len(groups) == 0
@@ -0,0 +1,196 @@
+"""
+When fetch_all_team_picks reuses cached picks and when it refetches them.
+
+Picks are served from recorded responses by api.FixtureAdapter, which also
+records the URLs requested, so each test can tell which teams were refetched.
+"""
+import json
+import os
+
+import pytest
+
+from fpl_similarity import api, picks_cache, pipeline
+
+GAMEWEEK = 5
+TEAM_IDS = [11, 12, 13]
+
+
+class RecordingFixtureAdapter(api.FixtureAdapter):
+    """A FixtureAdapter that remembers the team of every picks request."""
+
+    def __init__(self, fixture_directory):
+        super().__init__(fixture_directory)
+        self.requested = []
+
+    def send(self, request, **kwargs):
+        self.requested.append(int(request.url.split('/entry/')[1].split('/')[0]))
+        return super().send(request, **kwargs)
+
+    def take(self):
+        """Returns the teams requested since the last call, sorted."""
+        requested, self.requested = sorted(self.requested), []
+        return requested
+
+
+def picks_url(team_id, gameweek):
+    return f"https://fantasy.premierleague.com/api/entry/{team_id}/event/{gameweek}/picks/"
+
+
+def write_picks(adapter, team_id, gameweek, points):
+    """Records the picks response of a team, scoring `points` in the gameweek."""
+    elements = [team_id * 100 + i for i in range(1, 16)]
+    payload = {
+        'active_chip': None,
+        'entry_history': {'points': points, 'total_points': 300 + points, 'rank': 1000, 'overall_rank': 5000,
+                          'event_transfers_cost': 0},
+        'picks': [{'element': element, 'position': i, 'multiplier': 1, 'is_captain': i == 1, 'is_vice_captain': i == 2}
+                  for i, element in enumerate(elements, 1)],
+    }
+    path = api.fixture_path(adapter.fixture_directory, picks_url(team_id, gameweek))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(payload, f)
+
+
+def standings(points, with_points=True):
+    """The managers' standings entries, with their gameweek points keyed by team ID."""
+    managers = []
+    for rank, team_id in enumerate(TEAM_IDS, 1):
+        manager = {'name': f'Manager {team_id}', 'team_name': f'Team {team_id}', 'team_id': team_id}
+        if with_points:
+            manager.update(event_total=points[team_id], total=300 + points[team_id], rank=rank, last_rank=rank)
+        managers.append(manager)
+    return managers
+
+
+@pytest.fixture
+def adapter(tmp_path):
+    adapter = RecordingFixtureAdapter(str(tmp_path / 'fixtures'))
+    requests_per_second = api.REQUESTS_PER_SECOND
+    api.set_transport(adapter)
+    api.configure(requests_per_second=10000)
+    yield adapter
+    api.set_transport(None)
+    api.configure(requests_per_second=requests_per_second)
+
+
+@pytest.fixture
+def cache_file(tmp_path):
+    path = str(tmp_path / 'picks.sqlite3')
+    yield path
+    cache = picks_cache._open_caches.pop(path, None)
+    if cache is not None:
+        cache.close()
+
+
+@pytest.fixture
+def points(adapter):
+    """Records each team's picks and returns their gameweek points."""
+    points = {team_id: 40 + i for i, team_id in enumerate(TEAM_IDS)}
+    for team_id, team_points in points.items():
+        write_picks(adapter, team_id, GAMEWEEK, team_points)
+    return points
+
+
+def fetch(managers, cache_file, finished=False, gameweek=GAMEWEEK):
+    return pipeline.fetch_all_team_picks(managers, 1, gameweek, GAMEWEEK, finished, cache_file=cache_file)
+
+
+def cached_entries(cache_file, gameweek=GAMEWEEK):
+    return picks_cache.open_cache(cache_file).get_entries(TEAM_IDS, gameweek)
+
+
+def test_unchanged_standings_reuse_cached_picks(adapter, cache_file, points):
+    batch = fetch(standings(points), cache_file)
+    assert adapter.take() == TEAM_IDS
+    assert batch.gw_points.tolist() == [points[team_id] for team_id in TEAM_IDS]
+
+    # A new league rank alone does not change the picks response
+    managers = standings(points)
+    managers.reverse()
+    for rank, manager in enumerate(managers, 1):
+        manager['rank'] = rank
+    batch = fetch(managers, cache_file)
+    assert adapter.take() == []
+    assert batch.gw_points.tolist() == [points[manager['team_id']] for manager in managers]
+
+
+def test_changed_standings_refetch_picks(adapter, cache_file, points):
+    fetch(standings(points), cache_file)
+    adapter.take()
+
+    points[12] += 6
+    write_picks(adapter, 12, GAMEWEEK, points[12])
+    batch = fetch(standings(points), cache_file)
+    assert adapter.take() == [12]
+    assert batch.gw_points.tolist() == [points[team_id] for team_id in TEAM_IDS]
+    assert cached_entries(cache_file)[12].fingerprint == pipeline.standings_fingerprint(standings(points)[1])
+
+
+def test_finished_gameweek_marks_unchanged_picks_final(adapter, cache_file, points):
+    fetch(standings(points), cache_file)
+    adapter.take()
+    assert not any(entry.fetched_after_finished for entry in cached_entries(cache_file).values())
+
+    # Team 13 scored again before the gameweek finished
+    points[13] += 2
+    write_picks(adapter, 13, GAMEWEEK, points[13])
+    batch = fetch(standings(points), cache_file, finished=True)
+    assert adapter.take() == [13]
+    assert batch.gw_points.tolist() == [points[team_id] for team_id in TEAM_IDS]
+    assert all(entry.fetched_after_finished for entry in cached_entries(cache_file).values())
+
+    fetch(standings(points), cache_file, finished=True)
+    assert adapter.take() == []
+
+
+def test_without_standings_picks_are_refetched_once_after_the_gameweek(adapter, cache_file, points):
+    managers = standings(points, with_points=False)
+    fetch(managers, cache_file)
+    assert adapter.take() == TEAM_IDS
+    assert all(entry.fingerprint is None for entry in cached_entries(cache_file).values())
+
+    fetch(managers, cache_file)
+    assert adapter.take() == []
+
+    fetch(managers, cache_file, finished=True)
+    assert adapter.take() == TEAM_IDS
+    assert all(entry.fetched_after_finished for entry in cached_entries(cache_file).values())
+
+    fetch(managers, cache_file, finished=True)
+    assert adapter.take() == []
+
+
+def test_cached_picks_without_fingerprint_are_refetched_after_the_gameweek(adapter, cache_file, points):
+    # Picks cached before fingerprints were stored cannot be compared with the standings
+    fetch(standings(points, with_points=False), cache_file)
+    adapter.take()
+
+    fetch(standings(points), cache_file)
+    assert adapter.take() == []
+
+    fetch(standings(points), cache_file, finished=True)
+    assert adapter.take() == TEAM_IDS
+
+
+def test_previous_gameweeks_always_use_the_cache(adapter, cache_file, points):
+    for team_id, team_points in points.items():
+        write_picks(adapter, team_id, GAMEWEEK - 1, team_points)
+    fetch(standings(points), cache_file, gameweek=GAMEWEEK - 1)
+    assert adapter.take() == TEAM_IDS
+
+    points[11] += 10
+    fetch(standings(points), cache_file, gameweek=GAMEWEEK - 1)
+    assert adapter.take() == []
+    assert all(entry.fetched_after_finished for entry in cached_entries(cache_file, GAMEWEEK - 1).values())
+
+
+def test_teams_without_picks_are_cached(adapter, cache_file, points):
+    os.remove(api.fixture_path(adapter.fixture_directory, picks_url(12, GAMEWEEK)))
+    batch = fetch(standings(points), cache_file)
+    assert adapter.take() == TEAM_IDS
+    assert batch.valid.tolist() == [True, False, True]
+
+    batch = fetch(standings(points), cache_file)
+    assert adapter.take() == []
+    assert batch.valid.tolist() == [True, False, True]
@@ -0,0 +1,131 @@
+"""
+The weighted team matrix must match the vectors of the original per-team implementation.
+"""
+import random
+
+import numpy as np
+import pytest
+
+from fpl_similarity import grouping, records, vectorize
+
+
+def create_weighted_vector(team, all_player_ids, player_prices, captain, vice_captain, active_chip):
+    """The per-team weighted vector as analysis.py used to build it, kept as the reference."""
+    vector = np.zeros(len(all_player_ids))
+    for player_id, position in team:
+        if player_id in all_player_ids:
+            index = all_player_ids.index(player_id)
+            price_weight = player_prices.get(player_id, 4.0)
+            scaled_price = (price_weight / 15.0) ** 2
+            if active_chip == 'bboost' or position <= 11:
+                position_weight = 1
+            else:
+                position_weight = 0.1
+            if player_id == captain:
+                if active_chip == '3xc':
+                    position_weight *= 2.0
+                else:
+                    position_weight *= 1.5
+            vector[index] = scaled_price * position_weight
+    return vector
+
+
+def random_teams(n, seed=0, max_player_id=700, squad_size=records.SQUAD_SIZE):
+    rng = random.Random(seed)
+    teams, captains, chips = [], [], []
+    for _ in range(n):
+        elements = rng.sample(range(1, max_player_id + 1), squad_size)
+        teams.append(list(zip(elements, rng.sample(range(1, squad_size + 1), squad_size))))
+        captains.append(rng.choice(elements))
+        chips.append(rng.choice([None, None, None, 'bboost', '3xc', 'freehit', 'wildcard']))
+    return teams, captains, chips
+
+
+def random_prices(seed=0, max_player_id=700):
+    rng = random.Random(seed)
+    return {player_id: rng.randrange(38, 150) / 10 for player_id in range(1, max_player_id + 1) if rng.random() < 0.9}
+
+
+def reference_matrix(teams, captains, chips, player_prices, player_ids):
+    all_player_ids = list(player_ids)
+    return np.array([
+        create_weighted_vector(team, all_player_ids, player_prices, captain, None, chip)
+        for team, captain, chip in zip(teams, captains, chips)
+    ]).reshape(len(teams), len(all_player_ids))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_build_team_matrix_matches_reference(seed):
+    teams, captains, chips = random_teams(200, seed)
+    player_prices = random_prices(seed)
+    matrix, player_ids = vectorize.build_team_matrix(teams, captains, chips, player_prices)
+    assert player_ids.tolist() == sorted({player_id for team in teams for player_id, _ in team})
+    np.testing.assert_allclose(matrix.toarray(), reference_matrix(teams, captains, chips, player_prices, player_ids))
+
+
+def test_price_lookup_matches_mapping():
+    teams, captains, chips = random_teams(50, seed=4)
+    player_prices = random_prices(4, max_player_id=600)  # Players above 600 have no price
+    from_mapping, ids_from_mapping = vectorize.build_team_matrix(teams, captains, chips, player_prices)
+    from_lookup, ids_from_lookup = vectorize.build_team_matrix(teams, captains, chips, vectorize.price_lookup(player_prices))
+    np.testing.assert_array_equal(ids_from_mapping, ids_from_lookup)
+    np.testing.assert_allclose(from_mapping.toarray(), from_lookup.toarray())
+    np.testing.assert_allclose(from_lookup.toarray(), reference_matrix(teams, captains, chips, player_prices, ids_from_lookup))
+
+
+@pytest.mark.parametrize('chip, captain_weight, bench_weight', [
+    (None, 1.5, 0.1),
+    ('bboost', 1.5, 1.0),
+    ('3xc', 2.0, 0.1),
+    ('wildcard', 1.5, 0.1),
+])
+def test_chip_weights(chip, captain_weight, bench_weight):
+    team = [(player_id, player_id) for player_id in range(1, 16)]
+    player_prices = {player_id: 7.5 for player_id in range(1, 16)}
+    matrix, _ = vectorize.build_team_matrix([team], [3], [chip], player_prices)
+    row = matrix.toarray()[0] / (7.5 / 15.0) ** 2
+    np.testing.assert_allclose(row, [1, 1, captain_weight] + [1] * 8 + [bench_weight] * 4)
+
+
+def test_captain_on_the_bench():
+    team = [(player_id, player_id) for player_id in range(1, 16)]
+    player_prices = {13: 6.0}
+    for chip in (None, 'bboost', '3xc'):
+        matrix, player_ids = vectorize.build_team_matrix([team], [13], [chip], player_prices)
+        np.testing.assert_allclose(matrix.toarray(), reference_matrix([team], [13], [chip], player_prices, player_ids))
+
+
+def test_short_squads():
+    short, full = random_teams(30, seed=8, squad_size=11), random_teams(30, seed=9)
+    teams, captains, chips = (a + b for a, b in zip(short, full))
+    player_prices = random_prices(8)
+    matrix, player_ids = vectorize.build_team_matrix(teams, captains, chips, player_prices)
+    np.testing.assert_allclose(matrix.toarray(), reference_matrix(teams, captains, chips, player_prices, player_ids))
+
+
+def test_no_teams():
+    matrix, player_ids = vectorize.build_team_matrix([], [], [], {1: 5.0})
+    assert matrix.shape == (0, 0)
+    assert len(player_ids) == 0
+
+
+def test_weighted_matrix_from_flat_arrays():
+    teams, captains, chips = random_teams(100, seed=5)
+    player_prices = vectorize.price_lookup(random_prices(5))
+    elements, positions, counts = vectorize.flatten_teams(teams)
+    flat, flat_ids = vectorize.weighted_matrix(elements, positions, counts, captains, chips, player_prices)
+    built, built_ids = vectorize.build_team_matrix(teams, captains, chips, player_prices)
+    np.testing.assert_array_equal(flat_ids, built_ids)
+    assert (flat != built).nnz == 0
+
+
+def test_team_groups_matrix_matches_reference():
+    teams, captains, chips = random_teams(80, seed=6)
+    player_prices = random_prices(6)
+    groups = grouping.TeamGroups()
+    for i, (team, captain, chip) in enumerate(zip(teams, captains, chips)):
+        elements, positions = zip(*team)
+        picks = records.TeamPicks(elements, positions, captain, None, 0, None, 0, None, chip)
+        groups.add({'name': f'Manager {i}', 'team_name': f'Team {i}', 'team_id': i}, picks)
+    matrix, player_ids = groups.team_matrix(vectorize.price_lookup(player_prices))
+    np.testing.assert_allclose(matrix.toarray(), reference_matrix(teams, captains, chips, player_prices, player_ids))
@@ -1,14 +1,12 @@
 #!/bin/bash
+# One-off refresh of the current gameweek, for hosts without the
+# fpl-league-similarity-refresh pm2 app (fpl_similarity/daemon.py). Do not
+# schedule it where that app runs: both write the same results and run report.
+# If the app is running, the daemon's lock makes this exit without doing anything.
+# Both write to the data directory that server.js serves, so no rebuild or reload is needed.
 cd /home/dev/fpl-league-similarity
 source venv/bin/activate
 
-# Generate new data files
-python analysis.py >> analysis.log 2>&1
+FPL_DATA_DIRECTORY=./data python -m fpl_similarity.daemon --once >> analysis.log 2>&1
 
-# Rebuild Angular with new data
-ng build >> analysis.log 2>&1
-
-# Reload will gracefully restart and pick up the new build
-pm2 reload fpl-league-similarity >> analysis.log 2>&1
-
-deactivate
\ No newline at end of file
+deactivate